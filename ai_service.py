@@ -1,28 +1,93 @@
 import json
-from google import genai
+import time
 from flask import current_app
-from models import Quiz, Question, db
+from models import Quiz, Question, QuizJob, db
+from quiz_cache import quiz_cache
+from question_bank import question_bank
+from answer_key import answer_keys
+from metrics import metrics
+from gemini_client import gemini, GeminiUnavailable
 
-class AIQuizGenerator:
+GEMINI_MODEL = 'gemini-3-flash-preview'
+REQUIRED_QUESTION_FIELDS = ['question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_option', 'explanation']
+
+def validate_question_data(q, number):
+    """Raise ValueError if a parsed question is missing fields or has an invalid answer"""
+    if not isinstance(q, dict):
+        raise ValueError(f"Question {number} is not an object")
+    
+    for field in REQUIRED_QUESTION_FIELDS:
+        if field not in q:
+            raise ValueError(f"Missing field '{field}' in question {number}")
+    
+    if q['correct_option'] not in ['A', 'B', 'C', 'D']:
+        raise ValueError(f"Invalid correct_option '{q['correct_option']}' in question {number}")
+
+class QuestionStreamParser:
+    """Incrementally pull complete question objects out of a streamed JSON array"""
+    
     def __init__(self):
-        self.client = None
-        api_key = current_app.config.get('GEMINI_API_KEY')
+        self.buffer = ''
+        self.pos = 0
+        self.in_array = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.obj_start = None
+        self.errors = 0
+    
+    def feed(self, text):
+        """Add a chunk of model output and return the questions it completed"""
+        self.buffer += text
+        questions = []
         
-        if api_key and api_key != 'your-new-api-key-here':
-            try:
-                self.client = genai.Client(api_key=api_key)
-            except Exception as e:
-                current_app.logger.error(f"Failed to initialize Gemini client: {e}")
-                self.client = None
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+            
+            if not self.in_array:
+                self.in_array = char == '['
+            elif self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                if self.depth == 0:
+                    self.obj_start = self.pos
+                self.depth += 1
+            elif char == '}' and self.depth:
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        questions.append(json.loads(self.buffer[self.obj_start:self.pos + 1]))
+                    except json.JSONDecodeError:
+                        self.errors += 1
+                    # Drop everything already parsed so the buffer stays small
+                    self.buffer = self.buffer[self.pos + 1:]
+                    self.pos = -1
+                    self.obj_start = None
+            
+            self.pos += 1
+        
+        return questions
+
+class AIQuizGenerator:
+    def __init__(self):
+        # All generators share the process-wide client and its connection pool
+        self.client = gemini if gemini.available else None
     
-    def generate_quiz_prompt(self, topic, difficulty):
+    def generate_quiz_prompt(self, topic, difficulty, count=10):
         difficulty_descriptions = {
             'simple': 'basic level questions suitable for beginners',
             'medium': 'intermediate level questions with moderate complexity',
             'hard': 'advanced level questions requiring deep understanding'
         }
         
-        prompt = f"""Generate exactly 10 multiple-choice questions about "{topic}" at {difficulty_descriptions[difficulty]} level.
+        prompt = f"""Generate exactly {count} multiple-choice questions about "{topic}" at {difficulty_descriptions[difficulty]} level.
 
 Requirements:
 1. Each question must have exactly 4 options (A, B, C, D)
@@ -47,11 +112,11 @@ Format your response as a JSON array with this exact structure:
 
 Topic: {topic}
 Difficulty: {difficulty}
-Number of questions: 10"""
+Number of questions: {count}"""
         
         return prompt
     
-    def parse_ai_response(self, response_text):
+    def parse_ai_response(self, response_text, count=10):
         """Parse AI response and extract questions"""
         try:
             # Try to extract JSON from the response
@@ -65,74 +130,328 @@ Number of questions: 10"""
             questions_data = json.loads(json_str)
             
             # Validate the structure
-            if not isinstance(questions_data, list) or len(questions_data) != 10:
-                raise ValueError("Response must contain exactly 10 questions")
+            if not isinstance(questions_data, list) or len(questions_data) != count:
+                raise ValueError(f"Response must contain exactly {count} questions")
             
             for i, q in enumerate(questions_data):
-                required_fields = ['question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_option', 'explanation']
-                for field in required_fields:
-                    if field not in q:
-                        raise ValueError(f"Missing field '{field}' in question {i+1}")
-                
-                if q['correct_option'] not in ['A', 'B', 'C', 'D']:
-                    raise ValueError(f"Invalid correct_option '{q['correct_option']}' in question {i+1}")
+                validate_question_data(q, i + 1)
             
             return questions_data
             
         except (json.JSONDecodeError, ValueError) as e:
             current_app.logger.error(f"Failed to parse AI response: {e}")
+            metrics.inc('parse_failures_total')
             return None
     
-    def generate_quiz(self, topic, difficulty):
-        """Generate a complete quiz with AI"""
+    def generate_quiz(self, topic, difficulty, use_cache=True, allow_fallback=True, stream=False, on_progress=None,
+                      cache=True):
+        """Generate a complete quiz with AI.
+        
+        ``use_cache`` controls reading a cached quiz; ``cache=False`` keeps the
+        new quiz out of the cache, for quizzes that must reach a single user.
+        """
         try:
+            cached_quiz = quiz_cache.get(topic, difficulty) if use_cache else None
+            if cached_quiz:
+                return cached_quiz
+            
             if not self.client:
-                return self._generate_fallback_quiz(topic, difficulty)
+                return self._generate_fallback_quiz(topic, difficulty) if allow_fallback else None
             
-            prompt = self.generate_quiz_prompt(topic, difficulty)
+            if stream:
+                quiz = self._generate_quiz_streaming(topic, difficulty, on_progress, cache=cache)
+                if quiz:
+                    return quiz
+                return self._generate_fallback_quiz(topic, difficulty) if allow_fallback else None
+            
+            # Gemini only writes the questions the bank cannot supply
+            banked = self._bank_questions(topic, difficulty)
+            shortfall = current_app.config.get('QUIZ_QUESTIONS_COUNT', 10) - len(banked)
+            if shortfall <= 0:
+                return self._save_quiz(topic, difficulty, banked, banked=len(banked), cache=cache)
+            
+            prompt = self.generate_quiz_prompt(topic, difficulty, shortfall)
             
             # Call Gemini API
-            response = self.client.models.generate_content(
-                model='gemini-3-flash-preview',
-                contents=prompt
-            )
+            started = time.perf_counter()
+            response = self.client.generate(GEMINI_MODEL, prompt)
+            metrics.observe('gemini_request_duration_seconds', time.perf_counter() - started, mode='full')
             
             response_text = response.text
-            questions_data = self.parse_ai_response(response_text)
+            questions_data = self.parse_ai_response(response_text, shortfall)
             
             if not questions_data:
-                return self._generate_fallback_quiz(topic, difficulty)
+                return self._generate_fallback_quiz(topic, difficulty) if allow_fallback else None
             
-            # Create quiz in database
+            return self._save_quiz(topic, difficulty, banked + questions_data, banked=len(banked), cache=cache)
+            
+        except GeminiUnavailable as e:
+            current_app.logger.warning(f"Gemini unavailable, skipping AI generation: {e}")
+            db.session.rollback()
+            return self._generate_fallback_quiz(topic, difficulty) if allow_fallback else None
+        
+        except Exception as e:
+            current_app.logger.error(f"AI quiz generation failed: {e}")
+            metrics.inc('gemini_failures_total', mode='full')
+            db.session.rollback()
+            return self._generate_fallback_quiz(topic, difficulty) if allow_fallback else None
+    
+    def _bank_questions(self, topic, difficulty):
+        """Bank questions to start a quiz with, or none if too few match to be worth it"""
+        banked = question_bank.find(topic, difficulty, current_app.config.get('QUIZ_QUESTIONS_COUNT', 10))
+        if len(banked) < question_bank.min_matches:
+            return []
+        metrics.inc('question_bank_questions_total', len(banked))
+        return banked
+    
+    def _save_quiz(self, topic, difficulty, questions_data, banked=0, cache=True):
+        """Store a quiz with its questions, adding all but the first ``banked`` to the question bank"""
+        quiz = Quiz(topic=topic, difficulty=difficulty)
+        db.session.add(quiz)
+        db.session.flush()
+        
+        # Create questions
+        questions = []
+        for i, q_data in enumerate(questions_data, 1):
+            question = Question(
+                quiz_id=quiz.id,
+                question_text=q_data['question_text'],
+                option_a=q_data['option_a'],
+                option_b=q_data['option_b'],
+                option_c=q_data['option_c'],
+                option_d=q_data['option_d'],
+                correct_option=q_data['correct_option'],
+                explanation=q_data['explanation'],
+                question_number=i
+            )
+            db.session.add(question)
+            questions.append(question)
+        
+        db.session.flush()
+        question_bank.add(questions[banked:], topic, difficulty)
+        db.session.commit()
+        if cache:
+            quiz_cache.put(topic, difficulty, quiz)
+        return quiz
+    
+    def _save_streamed_questions(self, quiz_id, topic, difficulty, number, questions_data, banked=False):
+        """Commit questions numbered from ``number``, creating the quiz on the first call; returns the quiz id"""
+        if quiz_id is None:
             quiz = Quiz(topic=topic, difficulty=difficulty)
             db.session.add(quiz)
             db.session.flush()
-            
-            # Create questions
-            for i, q_data in enumerate(questions_data, 1):
-                question = Question(
-                    quiz_id=quiz.id,
-                    question_text=q_data['question_text'],
-                    option_a=q_data['option_a'],
-                    option_b=q_data['option_b'],
-                    option_c=q_data['option_c'],
-                    option_d=q_data['option_d'],
-                    correct_option=q_data['correct_option'],
-                    explanation=q_data['explanation'],
-                    question_number=i
-                )
-                db.session.add(question)
-            
-            db.session.commit()
-            return quiz
-            
+            quiz_id = quiz.id
+        
+        questions = []
+        for i, q_data in enumerate(questions_data, number):
+            question = Question(
+                quiz_id=quiz_id,
+                question_text=q_data['question_text'],
+                option_a=q_data['option_a'],
+                option_b=q_data['option_b'],
+                option_c=q_data['option_c'],
+                option_d=q_data['option_d'],
+                correct_option=q_data['correct_option'],
+                explanation=q_data['explanation'],
+                question_number=i
+            )
+            db.session.add(question)
+            questions.append(question)
+        
+        if not banked:
+            db.session.flush()
+            question_bank.add(questions, topic, difficulty)
+        db.session.commit()
+        return quiz_id
+    
+    async def agenerate_quiz(self, topic, difficulty, run_db, allow_fallback=True, stream=False, on_progress=None):
+        """Async counterpart of ``generate_quiz`` for the event-loop job runner.
+        
+        Gemini is awaited on the async client so many generations can be in
+        flight on one thread. Database work is handed to ``run_db(fn, *args)``,
+        which runs ``fn`` in a worker thread with its own app context and
+        session, so quizzes are passed around by id. ``on_progress(quiz_id,
+        number, total)`` is also called through ``run_db``. Returns the quiz id.
+        """
+        try:
+            if stream:
+                quiz_id = await self._agenerate_quiz_streaming(topic, difficulty, run_db, on_progress)
+            else:
+                banked = await run_db(self._bank_questions, topic, difficulty)
+                shortfall = current_app.config.get('QUIZ_QUESTIONS_COUNT', 10) - len(banked)
+                questions_data = []
+                if shortfall > 0:
+                    started = time.perf_counter()
+                    prompt = self.generate_quiz_prompt(topic, difficulty, shortfall)
+                    response = await gemini.agenerate(GEMINI_MODEL, prompt)
+                    metrics.observe('gemini_request_duration_seconds', time.perf_counter() - started, mode='async')
+                    questions_data = self.parse_ai_response(response.text, shortfall)
+                
+                quiz_id = None
+                if questions_data is not None:
+                    quiz_id = await run_db(lambda: self._save_quiz(topic, difficulty, banked + questions_data,
+                                                                   banked=len(banked)).id)
+            if quiz_id:
+                return quiz_id
+        
+        except GeminiUnavailable as e:
+            current_app.logger.warning(f"Gemini unavailable, skipping AI generation: {e}")
+        
         except Exception as e:
             current_app.logger.error(f"AI quiz generation failed: {e}")
+            metrics.inc('gemini_failures_total', mode='async')
+        
+        if not allow_fallback:
+            return None
+        return await run_db(lambda: self._generate_fallback_quiz(topic, difficulty).id)
+    
+    async def _agenerate_quiz_streaming(self, topic, difficulty, run_db, on_progress=None):
+        total = current_app.config.get('QUIZ_QUESTIONS_COUNT', 10)
+        parser = QuestionStreamParser()
+        quiz_id = None
+        number = 0
+        
+        banked = await run_db(self._bank_questions, topic, difficulty)
+        if banked:
+            quiz_id = await run_db(self._save_streamed_questions, None, topic, difficulty, 1, banked, True)
+            number = len(banked)
+            if on_progress:
+                await run_db(on_progress, quiz_id, number, total)
+        
+        started = time.perf_counter()
+        try:
+            if number < total:
+                prompt = self.generate_quiz_prompt(topic, difficulty, total - number)
+                async for chunk in gemini.agenerate_stream(GEMINI_MODEL, prompt):
+                    for q_data in parser.feed(chunk.text or ''):
+                        if number >= total:
+                            break
+                        try:
+                            validate_question_data(q_data, number + 1)
+                        except ValueError as e:
+                            current_app.logger.error(f"Skipping streamed question: {e}")
+                            continue
+                        
+                        number += 1
+                        quiz_id = await run_db(self._save_streamed_questions, quiz_id, topic, difficulty,
+                                               number, [q_data])
+                        if on_progress:
+                            await run_db(on_progress, quiz_id, number, total)
+                
+                metrics.observe('gemini_request_duration_seconds', time.perf_counter() - started, mode='async-stream')
+        
+        except Exception as e:
+            current_app.logger.error(f"AI quiz streaming failed: {e}")
+            metrics.inc('gemini_failures_total', mode='async-stream')
+        
+        if quiz_id is None:
+            return None
+        
+        if number < total:
+            current_app.logger.warning(f"Streamed quiz {quiz_id} ended with {number}/{total} questions")
+            questions_data = None
+            try:
+                started = time.perf_counter()
+                response = await gemini.agenerate(GEMINI_MODEL, self.generate_quiz_prompt(topic, difficulty,
+                                                                                          total - number))
+                metrics.observe('gemini_request_duration_seconds', time.perf_counter() - started, mode='async')
+                questions_data = self.parse_ai_response(response.text, total - number)
+            except Exception as e:
+                current_app.logger.error(f"Completing streamed quiz {quiz_id} failed: {e}")
+                metrics.inc('gemini_failures_total', mode='async')
+            if not questions_data:
+                await run_db(discard_quiz, quiz_id)
+                return None
+            await run_db(self._save_streamed_questions, quiz_id, topic, difficulty, number + 1, questions_data)
+            number = total
+            if on_progress:
+                await run_db(on_progress, quiz_id, number, total)
+        
+        await run_db(lambda: quiz_cache.put(topic, difficulty, db.session.get(Quiz, quiz_id)))
+        return quiz_id
+    
+    def _generate_quiz_streaming(self, topic, difficulty, on_progress=None, cache=True):
+        """Stream the Gemini response and commit each question as soon as it is complete.
+        
+        Matching question bank entries are committed first and Gemini only
+        writes the rest. Otherwise the quiz row is only created once the first
+        valid question arrives, so a stream that fails early leaves nothing
+        behind. If the stream ends early the missing questions are requested
+        in one non-streaming call, and the partial quiz is deleted when that
+        fails too. ``on_progress(quiz, number, total)`` is called after every commit.
+        """
+        total = current_app.config.get('QUIZ_QUESTIONS_COUNT', 10)
+        parser = QuestionStreamParser()
+        quiz = quiz_id = None
+        number = 0
+        
+        banked = self._bank_questions(topic, difficulty)
+        if banked:
+            quiz_id = self._save_streamed_questions(None, topic, difficulty, 1, banked, banked=True)
+            quiz = db.session.get(Quiz, quiz_id)
+            number = len(banked)
+            if on_progress:
+                on_progress(quiz, number, total)
+        
+        started = time.perf_counter()
+        try:
+            if number < total:
+                prompt = self.generate_quiz_prompt(topic, difficulty, total - number)
+                for chunk in self.client.generate_stream(GEMINI_MODEL, prompt):
+                    for q_data in parser.feed(chunk.text or ''):
+                        if number >= total:
+                            break
+                        try:
+                            validate_question_data(q_data, number + 1)
+                        except ValueError as e:
+                            current_app.logger.error(f"Skipping streamed question: {e}")
+                            continue
+                        
+                        number += 1
+                        quiz_id = self._save_streamed_questions(quiz_id, topic, difficulty, number, [q_data])
+                        quiz = quiz or db.session.get(Quiz, quiz_id)
+                        if on_progress:
+                            on_progress(quiz, number, total)
+                
+                metrics.observe('gemini_request_duration_seconds', time.perf_counter() - started, mode='stream')
+        
+        except Exception as e:
+            current_app.logger.error(f"AI quiz streaming failed: {e}")
+            metrics.inc('gemini_failures_total', mode='stream')
             db.session.rollback()
-            return self._generate_fallback_quiz(topic, difficulty)
+        
+        if quiz is None:
+            return None
+        
+        # Questions already shown to the user are kept; a stream that ended
+        # early is finished with one non-streaming request for the rest
+        if number < total:
+            current_app.logger.warning(f"Streamed quiz {quiz.id} ended with {number}/{total} questions")
+            questions_data = None
+            try:
+                started = time.perf_counter()
+                response = self.client.generate(GEMINI_MODEL, self.generate_quiz_prompt(topic, difficulty,
+                                                                                        total - number))
+                metrics.observe('gemini_request_duration_seconds', time.perf_counter() - started, mode='full')
+                questions_data = self.parse_ai_response(response.text, total - number)
+            except Exception as e:
+                current_app.logger.error(f"Completing streamed quiz {quiz.id} failed: {e}")
+                metrics.inc('gemini_failures_total', mode='full')
+            if not questions_data:
+                discard_quiz(quiz.id)
+                return None
+            self._save_streamed_questions(quiz.id, topic, difficulty, number + 1, questions_data)
+            number = total
+            if on_progress:
+                on_progress(quiz, number, total)
+        
+        if cache:
+            quiz_cache.put(topic, difficulty, quiz)
+        return quiz
     
     def _generate_fallback_quiz(self, topic, difficulty):
         """Generate a fallback quiz when AI is unavailable"""
+        metrics.inc('quiz_fallbacks_total')
         # Create a sample quiz for demonstration
         quiz = Quiz(topic=topic, difficulty=difficulty)
         db.session.add(quiz)
@@ -170,33 +489,20 @@ Number of questions: 10"""
         db.session.commit()
         return quiz
 
+def discard_quiz(quiz_id):
+    """Delete a quiz that could not be finished and detach it from its job"""
+    current_app.logger.warning(f"Discarding incomplete quiz {quiz_id}")
+    db.session.rollback()
+    QuizJob.query.filter_by(quiz_id=quiz_id).update({'quiz_id': None})
+    quiz = db.session.get(Quiz, quiz_id)
+    if quiz is not None:
+        db.session.delete(quiz)
+    question_bank.remove_quiz(quiz_id)
+    db.session.commit()
+
 def calculate_quiz_score(quiz_id, user_answers):
     """Calculate score and return detailed results"""
-    questions = Question.query.filter_by(quiz_id=quiz_id).order_by(Question.question_number).all()
-    
-    score = 0
-    results = []
-    
-    for question in questions:
-        user_answer = user_answers.get(str(question.id))
-        is_correct = user_answer == question.correct_option
-        
-        if is_correct:
-            score += 1
-        
-        results.append({
-            'question_number': question.question_number,
-            'question_text': question.question_text,
-            'options': {
-                'A': question.option_a,
-                'B': question.option_b,
-                'C': question.option_c,
-                'D': question.option_d
-            },
-            'user_answer': user_answer,
-            'correct_answer': question.correct_option,
-            'is_correct': is_correct,
-            'explanation': question.explanation
-        })
-    
-    return score, results
\ No newline at end of file
+    key = answer_keys.get(quiz_id)
+    if key is None:
+        return 0, []
+    return key.grade(user_answers)
@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from answer_key import UNANSWERED, answer_keys
+from models import AnalyticsCursor, LeaderboardEntry, QuestionStats, QuizResult, User, UserStats, db
+from topic_index import canonical_topic
+
+CURSOR = 'quiz_results'
+
+
+class Analytics:
+    """Leaderboards and per-question stats rolled up from quiz results in batches.
+
+    Submitting a quiz does no extra work: a background aggregator folds new
+    ``quiz_results`` rows (by id, past a cursor stored in the database) into
+    ``question_stats`` and ``leaderboard_entries`` with upserts. The cursor
+    is advanced with a conditional UPDATE in the same transaction, so with
+    several processes each batch is counted exactly once. Reads are prefix
+    scans of bounded size on indexed rollups and never touch quiz_results.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 10
+        self.batch_size = 5000
+        self.max_limit = 100
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('ANALYTICS_INTERVAL', 10)
+        self.batch_size = app.config.get('ANALYTICS_BATCH_SIZE', 5000)
+        self.max_limit = app.config.get('LEADERBOARD_MAX_SIZE', 100)
+
+    def start(self):
+        """Start the aggregator once per process"""
+        if not self.interval:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='analytics', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.app.app_context():
+                try:
+                    self.catch_up()
+                except Exception as e:
+                    self.app.logger.error(f"Analytics aggregator error: {e}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def catch_up(self):
+        """Aggregate batches until no new results are left; returns the number folded in"""
+        total = 0
+        while True:
+            processed = self.aggregate()
+            if not processed:
+                return total
+            total += processed
+
+    def rebuild(self):
+        """Drop the rollups and aggregate every result again"""
+        QuestionStats.query.delete()
+        LeaderboardEntry.query.delete()
+        AnalyticsCursor.query.filter_by(name=CURSOR).delete()
+        db.session.commit()
+        return self.catch_up()
+
+    def _cursor(self):
+        cursor = db.session.get(AnalyticsCursor, CURSOR)
+        if cursor is None:
+            try:
+                db.session.add(AnalyticsCursor(name=CURSOR, last_result_id=0))
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+            cursor = db.session.get(AnalyticsCursor, CURSOR)
+        return cursor.last_result_id
+
+    def aggregate(self):
+        """Fold the next batch of results into the rollups; returns the batch size"""
+        last_id = self._cursor()
+        rows = db.session.query(QuizResult.id, QuizResult.user_id, QuizResult.quiz_id, QuizResult.score,
+                                QuizResult.user_answers, QuizResult.taken_at)\
+                         .filter(QuizResult.id > last_id)\
+                         .order_by(QuizResult.id).limit(self.batch_size).all()
+        if not rows:
+            return 0
+
+        questions = {}
+        boards = {}
+        for row in rows:
+            key = answer_keys.get(row.quiz_id)
+            if key is None or not len(key):
+                continue
+
+            for question_id, correct, code in zip(key.question_ids, key.correct, key.decode(row.user_answers)):
+                counts = questions.get(question_id)
+                if counts is None:
+                    counts = questions[question_id] = {
+                        'question_id': int(question_id), 'quiz_id': key.quiz_id, 'correct_option': correct,
+                        'attempts': 0, 'correct': 0, 'option_a': 0, 'option_b': 0, 'option_c': 0, 'option_d': 0
+                    }
+                counts['attempts'] += 1
+                if code != UNANSWERED:
+                    counts['option_' + chr(code).lower()] += 1
+                    counts['correct'] += chr(code) == correct
+
+            taken_at = row.taken_at or datetime.utcnow()
+            for scope, scope_key in (('quiz', str(key.quiz_id)), ('topic', canonical_topic(key.topic))):
+                entry = boards.get((scope, scope_key, row.user_id))
+                if entry is None:
+                    entry = boards[(scope, scope_key, row.user_id)] = {
+                        'scope': scope, 'scope_key': scope_key, 'user_id': row.user_id,
+                        'best_score': row.score, 'achieved_at': taken_at, 'attempts': 0, 'total_score': 0
+                    }
+                elif row.score > entry['best_score']:
+                    entry['best_score'] = row.score
+                    entry['achieved_at'] = taken_at
+                entry['attempts'] += 1
+                entry['total_score'] += row.score
+
+        # Claiming the batch takes the write lock first; a concurrent
+        # aggregator that read the same batch finds the cursor moved and backs off
+        claimed = AnalyticsCursor.query.filter_by(name=CURSOR, last_result_id=last_id)\
+                                       .update({'last_result_id': rows[-1].id}, synchronize_session=False)
+        if not claimed:
+            db.session.rollback()
+            return 0
+
+        insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+        if questions:
+            stmt = insert(QuestionStats)
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=[QuestionStats.question_id],
+                set_={column: getattr(QuestionStats, column) + getattr(stmt.excluded, column)
+                      for column in ('attempts', 'correct', 'option_a', 'option_b', 'option_c', 'option_d')}
+            ), list(questions.values()))
+        if boards:
+            stmt = insert(LeaderboardEntry)
+            improved = stmt.excluded.best_score > LeaderboardEntry.best_score
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=[LeaderboardEntry.scope, LeaderboardEntry.scope_key, LeaderboardEntry.user_id],
+                set_={
+                    'best_score': db.case((improved, stmt.excluded.best_score), else_=LeaderboardEntry.best_score),
+                    'achieved_at': db.case((improved, stmt.excluded.achieved_at), else_=LeaderboardEntry.achieved_at),
+                    'attempts': LeaderboardEntry.attempts + stmt.excluded.attempts,
+                    'total_score': LeaderboardEntry.total_score + stmt.excluded.total_score
+                }
+            ), list(boards.values()))
+        db.session.commit()
+        return len(rows)
+
+    def _limit(self, limit):
+        return max(1, min(limit or 10, self.max_limit))
+
+    def leaderboard(self, scope, scope_key, limit=10):
+        """Top users of a quiz or topic board as dicts, best first"""
+        if scope == 'topic':
+            scope_key = canonical_topic(scope_key)
+        rows = db.session.query(LeaderboardEntry, User.username)\
+                         .join(User, User.id == LeaderboardEntry.user_id)\
+                         .filter(LeaderboardEntry.scope == scope, LeaderboardEntry.scope_key == str(scope_key))\
+                         .order_by(LeaderboardEntry.best_score.desc(), LeaderboardEntry.achieved_at)\
+                         .limit(self._limit(limit)).all()
+        return [{
+            'rank': rank,
+            'username': username,
+            'best_score': entry.best_score,
+            'attempts': entry.attempts,
+            'average_score': round(entry.total_score / entry.attempts, 1) if entry.attempts else 0,
+            'achieved_at': entry.achieved_at.isoformat()
+        } for rank, (entry, username) in enumerate(rows, 1)]
+
+    def global_leaderboard(self, limit=10):
+        """Top users by total score across all quizzes, from the per-user stats rollup"""
+        rows = db.session.query(UserStats, User.username)\
+                         .join(User, User.id == UserStats.user_id)\
+                         .order_by(UserStats.total_score.desc())\
+                         .limit(self._limit(limit)).all()
+        return [{
+            'rank': rank,
+            'username': username,
+            'total_score': stats.total_score,
+            'total_quizzes': stats.total_quizzes,
+            'best_score': stats.best_score
+        } for rank, (stats, username) in enumerate(rows, 1)]
+
+    def question_stats(self, quiz_id):
+        """Per-question stats of a quiz, keyed by question id"""
+        return {str(stats.question_id): stats.to_dict()
+                for stats in QuestionStats.query.filter_by(quiz_id=quiz_id)}
+
+
+analytics = Analytics()
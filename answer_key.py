@@ -0,0 +1,173 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from models import Quiz, Question, QuizJob, db
+
+
+ANSWER_CODES = {'A': 65, 'B': 66, 'C': 67, 'D': 68}
+UNANSWERED = 45  # '-', never equal to a correct option
+
+
+def valid_answers(answers):
+    """True if ``answers`` is a form ``AnswerKey.pack`` accepts, with each option a string or None"""
+    if isinstance(answers, str):
+        return True
+    if isinstance(answers, dict):
+        answers = answers.values()
+    elif not isinstance(answers, (list, tuple)):
+        return False
+    return all(answer is None or isinstance(answer, str) for answer in answers)
+
+
+class AnswerKey:
+    """Immutable answer key of a finished quiz: question ids, correct options and texts"""
+
+    __slots__ = ('quiz_id', 'topic', 'difficulty', 'question_ids', 'correct', 'correct_packed', 'questions',
+                 'public_questions', 'payload', 'etag', 'complete')
+
+    def __init__(self, quiz, questions, complete=True):
+        self.quiz_id = quiz.id
+        self.topic = quiz.topic
+        self.difficulty = quiz.difficulty
+        self.question_ids = tuple(str(q.id) for q in questions)
+        self.correct = ''.join(q.correct_option for q in questions)
+        self.correct_packed = int.from_bytes(self.correct.encode('ascii'), 'big')
+        # (question_number, text, (A, B, C, D), explanation) per question
+        self.questions = tuple(
+            (q.question_number, q.question_text, (q.option_a, q.option_b, q.option_c, q.option_d), q.explanation)
+            for q in questions
+        )
+        # Questions without answers, as served to the quiz page
+        self.public_questions = tuple(q.to_dict(include_answer=False) for q in questions)
+        self.complete = complete
+
+        # A finished quiz never changes, so its API payload is serialized once
+        # and its hash doubles as a strong ETag
+        self.payload = None
+        self.etag = None
+        if complete:
+            self.payload = json.dumps({
+                'quiz': {'id': self.quiz_id, 'topic': self.topic, 'difficulty': self.difficulty},
+                'questions': self.public_questions,
+                'generating': False
+            }, separators=(',', ':')).encode('utf-8')
+            self.etag = hashlib.sha256(self.payload).hexdigest()[:32]
+
+    @property
+    def id(self):
+        return self.quiz_id
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def pack(self, answers):
+        """Pack answers into one byte per question, in question order.
+        
+        ``answers`` is either a {question_id: option} dict as submitted by
+        the quiz page, or a sequence/string of options by question number.
+        """
+        if isinstance(answers, dict):
+            answers = [answers.get(qid) for qid in self.question_ids]
+        codes = [ANSWER_CODES.get(answer, UNANSWERED) for answer in answers[:len(self.question_ids)]]
+        codes.extend([UNANSWERED] * (len(self.question_ids) - len(codes)))
+        return bytes(codes)
+
+    def score_packed(self, packed):
+        """Count matching bytes by XOR-ing the packed answers against the key as integers"""
+        diff = int.from_bytes(packed, 'big') ^ self.correct_packed
+        return diff.to_bytes(len(packed), 'big').count(0)
+
+    def encode(self, answers):
+        """Stored form of answers on a result: one option letter per question in order, '-' if unanswered"""
+        return self.pack(answers).decode('ascii')
+
+    def decode(self, stored):
+        """Packed answers from a stored result, including legacy {question_id: option} JSON"""
+        if stored.startswith('{'):
+            stored = json.loads(stored)
+        return self.pack(stored)
+
+    def grade(self, answers):
+        """Return the score and per-question breakdown.
+
+        ``answers`` is a stored result value or anything ``pack`` accepts.
+        """
+        packed = self.decode(answers) if isinstance(answers, str) else self.pack(answers)
+        score = 0
+        results = []
+
+        for code, correct, (number, text, options, explanation) in zip(packed, self.correct, self.questions):
+            user_answer = chr(code) if code != UNANSWERED else None
+            is_correct = user_answer == correct
+
+            if is_correct:
+                score += 1
+
+            results.append({
+                'question_number': number,
+                'question_text': text,
+                'options': dict(zip('ABCD', options)),
+                'user_answer': user_answer,
+                'correct_answer': correct,
+                'is_correct': is_correct,
+                'explanation': explanation
+            })
+
+        return score, results
+
+
+class AnswerKeyCache:
+    """Size-bounded LRU of answer keys shared by scoring and results rendering.
+
+    Questions never change once a quiz is complete, so keys are never
+    invalidated; quizzes still being streamed in are loaded but not cached.
+    """
+
+    def __init__(self, app=None):
+        self.max_entries = 1000
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('ANSWER_KEY_CACHE_SIZE', 1000)
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._keys), 'hits': self.hits, 'misses': self.misses}
+
+    def get(self, quiz_id):
+        """Return the quiz's AnswerKey, or None if the quiz does not exist"""
+        with self._lock:
+            key = self._keys.get(quiz_id)
+            if key is not None:
+                self._keys.move_to_end(quiz_id)
+                self.hits += 1
+                return key
+            self.misses += 1
+
+        quiz = db.session.get(Quiz, quiz_id)
+        if quiz is None:
+            return None
+        questions = Question.query.filter_by(quiz_id=quiz_id).order_by(Question.question_number).all()
+        key = AnswerKey(quiz, questions, complete=not QuizJob.is_generating(quiz_id))
+
+        if self.max_entries and key.complete:
+            with self._lock:
+                self._keys[quiz_id] = key
+                while len(self._keys) > self.max_entries:
+                    self._keys.popitem(last=False)
+        return key
+
+
+answer_keys = AnswerKeyCache()
@@ -1,9 +1,24 @@
 import os
 from flask import Flask, render_template
 from flask_login import LoginManager
-from flask_migrate import Migrate
+from jinja2 import FileSystemBytecodeCache
 from config import Config
-from models import db, User
+from models import db
+from storage import storage
+from quiz_cache import quiz_cache
+from job_queue import job_queue
+from quiz_pool import quiz_pool
+from answer_key import answer_keys
+from user_cache import user_cache
+from topic_index import topic_index
+from question_bank import question_bank, include_object
+from analytics import analytics
+from commands import register_commands, init_database
+from query_budget import init_query_budget
+from metrics import metrics
+from static_assets import static_assets
+from compression import compression
+from gemini_client import gemini
 
 def create_app():
     app = Flask(__name__)
@@ -13,9 +28,35 @@ def create_app():
     instance_path = os.path.join(os.path.dirname(__file__), 'instance')
     os.makedirs(instance_path, exist_ok=True)
     
-    # Initialize extensions
+    # Compiled templates are kept on disk, so a new process skips Jinja's
+    # parser; `flask compile-templates` fills the cache at deploy time
+    template_cache = app.config['TEMPLATE_CACHE_DIR'] or os.path.join(instance_path, 'jinja-cache')
+    try:
+        os.makedirs(template_cache, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(template_cache)
+    except OSError as e:
+        app.logger.warning(f"Template cache disabled: {e}")
+    
+    # Initialize extensions (storage sets engine options, so it goes first)
+    storage.init_app(app)
     db.init_app(app)
-    migrate = Migrate(app, db)
+    # Flask-Migrate pulls in alembic, which only the `flask db` commands need
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db, include_object=include_object)
+    quiz_cache.init_app(app)
+    job_queue.init_app(app)
+    quiz_pool.init_app(app)
+    answer_keys.init_app(app)
+    user_cache.init_app(app)
+    topic_index.init_app(app)
+    question_bank.init_app(app)
+    analytics.init_app(app)
+    gemini.init_app(app)
+    init_query_budget(app)
+    metrics.init_app(app, db)
+    static_assets.init_app(app)
+    compression.init_app(app)
     
     # Initialize Flask-Login
     login_manager = LoginManager()
@@ -26,7 +67,7 @@ def create_app():
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.load(int(user_id))
     
     # Register Blueprints
     from routes.main import main_bp
@@ -37,6 +78,8 @@ def create_app():
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(quiz_bp, url_prefix='/quiz')
     
+    register_commands(app)
+    
     # Error handlers
     @app.errorhandler(404)
     def not_found_error(error):
@@ -47,9 +90,26 @@ def create_app():
         db.session.rollback()
         return render_template('errors/500.html'), 500
     
-    # Create tables
-    with app.app_context():
-        db.create_all()
+    # Create tables, unless a fast start leaves that to `flask init-db`. The
+    # quiz pool then loads on its first pop(), and the generation workers and
+    # analytics aggregator, which poll their tables, start with the first
+    # request, so importing the app reads no table and still works before
+    # the schema exists
+    if app.config['STARTUP_MODE'] != 'fast':
+        with app.app_context():
+            init_database()
+            quiz_pool.start()
+        # Start generation workers after the jobs table exists so that jobs
+        # left over from a previous run are picked up by the first sweep
+        job_queue.start()
+        analytics.start()
+    else:
+        @app.before_request
+        def start_workers():
+            job_queue.start()
+            analytics.start()
+    
+    metrics.start()
     
     return app
 
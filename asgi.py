@@ -0,0 +1,10 @@
+"""ASGI entry point: ``uvicorn asgi:app``.
+
+The Flask app stays WSGI and runs on asgiref's thread pool. Pair it with
+QUIZ_JOB_MODE=async so quiz generation awaits Gemini on an event loop
+instead of holding a thread per quiz.
+"""
+from asgiref.wsgi import WsgiToAsgi
+from app import app as flask_app
+
+app = WsgiToAsgi(flask_app)
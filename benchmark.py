@@ -0,0 +1,421 @@
+"""Offline load benchmark for the create -> take -> submit -> results flow.
+
+Boots the app against a throwaway SQLite database with ``genai.Client``
+replaced by a local fake, drives concurrent simulated users through every
+blueprint and reports req/s, latency percentiles, time to first byte,
+bytes on the wire and SQL counts per endpoint. Results can be saved as a JSON baseline and compared later:
+
+    python benchmark.py --users 8 --rounds 5 --save baseline.json
+    python benchmark.py --users 8 --rounds 5 --compare baseline.json
+
+--processes forks several app processes onto the same database file, which
+is how concurrent writers (and SQLITE_MODE) are exercised.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+TOPICS = ['Python Basics', 'World History', 'Photosynthesis', 'Linear Algebra', 'Roman Empire',
+          'Machine Learning', 'Human Anatomy', 'Jazz Music', 'Climate Change', 'Operating Systems']
+DIFFICULTIES = ['simple', 'medium', 'hard']
+
+
+class FakeGeminiClient:
+    """Stand-in for ``genai.Client`` returning canned quizzes after a configurable delay"""
+
+    latency = 0.2
+    failure_rate = 0.0
+    stream_break_rate = 0.0
+    chunk_size = 200
+    calls = 0
+    failures = 0
+    _lock = threading.Lock()
+    _random = random.Random(0)
+
+    def __init__(self, *args, **kwargs):
+        self.models = self
+        self.aio = types.SimpleNamespace(models=FakeAsyncModels())
+
+    @classmethod
+    def _failed(cls):
+        with cls._lock:
+            cls.calls += 1
+            failed = cls._random.random() < cls.failure_rate
+            if failed:
+                cls.failures += 1
+        return failed
+
+    @classmethod
+    def _breaks(cls):
+        if not cls.stream_break_rate:
+            return False
+        with cls._lock:
+            return cls._random.random() < cls.stream_break_rate
+
+    @classmethod
+    def _call(cls):
+        if cls._failed():
+            time.sleep(cls.latency / 2)
+            raise RuntimeError('Simulated Gemini failure')
+
+    @staticmethod
+    def _payload(contents):
+        topic = contents.split('"')[1] if '"' in contents else 'General Knowledge'
+        count = int(contents.rsplit('Number of questions:', 1)[1]) if 'Number of questions:' in contents else 10
+        return json.dumps([{
+            'question_number': number,
+            'question_text': f'Benchmark question {number} about {topic} from call {FakeGeminiClient.calls}?',
+            'option_a': 'First option',
+            'option_b': 'Second option',
+            'option_c': 'Third option',
+            'option_d': 'Fourth option',
+            'correct_option': 'ABCD'[number % 4],
+            'explanation': f'Option {"ABCD"[number % 4]} is correct.'
+        } for number in range(1, count + 1)])
+
+    def generate_content(self, model, contents, **kwargs):
+        self._call()
+        time.sleep(self.latency)
+        return types.SimpleNamespace(text=self._payload(contents))
+
+    def generate_content_stream(self, model, contents, **kwargs):
+        self._call()
+        text = self._payload(contents)
+        chunks = range(0, len(text), self.chunk_size)
+        breaks = self._breaks()
+        for index, start in enumerate(chunks):
+            if breaks and index == len(chunks) // 2:
+                raise RuntimeError('Simulated stream break')
+            time.sleep(self.latency / len(chunks))
+            yield types.SimpleNamespace(text=text[start:start + self.chunk_size])
+
+
+class FakeAsyncModels:
+    """``client.aio.models`` counterpart of FakeGeminiClient, sleeping without blocking the loop"""
+
+    async def _call(self):
+        if FakeGeminiClient._failed():
+            await asyncio.sleep(FakeGeminiClient.latency / 2)
+            raise RuntimeError('Simulated Gemini failure')
+
+    async def generate_content(self, model, contents, **kwargs):
+        await self._call()
+        await asyncio.sleep(FakeGeminiClient.latency)
+        return types.SimpleNamespace(text=FakeGeminiClient._payload(contents))
+
+    async def generate_content_stream(self, model, contents, **kwargs):
+        await self._call()
+        return self._chunks(FakeGeminiClient._payload(contents))
+
+    async def _chunks(self, text):
+        size = FakeGeminiClient.chunk_size
+        chunks = range(0, len(text), size)
+        breaks = FakeGeminiClient._breaks()
+        for index, start in enumerate(chunks):
+            if breaks and index == len(chunks) // 2:
+                raise RuntimeError('Simulated stream break')
+            await asyncio.sleep(FakeGeminiClient.latency / len(chunks))
+            yield types.SimpleNamespace(text=text[start:start + size])
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency, status, SQL count, first byte and response size samples"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def request(self, client, name, method, url, **kwargs):
+        # Accept gzip like a browser and read the body as it is produced
+        headers = {'Accept-Encoding': 'gzip', **kwargs.pop('headers', {})}
+        started = time.perf_counter()
+        response = client.open(url, method=method, headers=headers, buffered=False, **kwargs)
+        chunks = iter(response.response)
+        body = [next(chunks, b'')]
+        first_byte = time.perf_counter() - started
+        body.extend(chunks)
+        response.close()
+        elapsed = time.perf_counter() - started
+
+        data = b''.join(body)
+        wire_bytes = len(data)
+        if response.headers.get('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        response.set_data(data)
+        sql = response.headers.get('X-SQL-Queries')
+        with self._lock:
+            self.samples[name].append((elapsed, response.status_code, int(sql) if sql is not None else None,
+                                       first_byte, wire_bytes, len(data)))
+        return response
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def simulate_user(app, recorder, number, rounds, seed):
+    """One user: register, take ``rounds`` quizzes, then browse dashboard, history and profile"""
+    rng = random.Random(seed + number)
+    client = app.test_client()
+    username = f'bench{number}'
+    password = 'benchmark-password'
+
+    recorder.request(client, 'main.index', 'GET', '/')
+    recorder.request(client, 'auth.register', 'POST', '/auth/register',
+                     json={'username': username, 'email': f'{username}@example.com', 'password': password})
+
+    for _ in range(rounds):
+        recorder.request(client, 'quiz.create_quiz[GET]', 'GET', '/quiz/create')
+        response = recorder.request(client, 'quiz.create_quiz', 'POST', '/quiz/create',
+                                    json={'topic': rng.choice(TOPICS), 'difficulty': rng.choice(DIFFICULTIES)})
+        data = response.get_json() or {}
+        quiz_id = data.get('quiz_id')
+
+        if data.get('job_id'):
+            deadline = time.monotonic() + 60
+            while time.monotonic() < deadline:
+                status = recorder.request(client, 'quiz.job_status', 'GET', data['status_url']).get_json() or {}
+                if status.get('status') == 'done':
+                    quiz_id = status.get('quiz_id')
+                    break
+                if status.get('status') == 'failed':
+                    break
+                time.sleep(0.05)
+
+        if not quiz_id:
+            continue
+
+        recorder.request(client, 'quiz.take_quiz', 'GET', f'/quiz/take/{quiz_id}')
+        questions = (recorder.request(client, 'quiz.get_quiz_questions', 'GET',
+                                      f'/quiz/api/quiz/{quiz_id}').get_json() or {}).get('questions', [])
+        answers = {str(q['id']): rng.choice('ABCD') for q in questions}
+        result = recorder.request(client, 'quiz.submit_quiz', 'POST', f'/quiz/api/quiz/{quiz_id}/submit',
+                                  json={'answers': answers}).get_json() or {}
+        if result.get('redirect_url'):
+            recorder.request(client, 'quiz.view_results', 'GET', result['redirect_url'])
+
+    recorder.request(client, 'main.dashboard', 'GET', '/dashboard')
+    recorder.request(client, 'quiz.quiz_history', 'GET', '/quiz/history')
+    recorder.request(client, 'quiz.history_api', 'GET', '/quiz/api/history')
+    recorder.request(client, 'auth.profile', 'GET', '/auth/profile')
+    recorder.request(client, 'main.about', 'GET', '/about')
+    recorder.request(client, 'auth.logout', 'GET', '/auth/logout')
+    recorder.request(client, 'auth.login', 'POST', '/auth/login',
+                     json={'identifier': username, 'password': password})
+
+
+def run_users(app, args, numbers):
+    """Drive a group of simulated users on threads; return their samples and Gemini call counts"""
+    recorder = Recorder()
+    with ThreadPoolExecutor(max_workers=max(1, len(numbers))) as executor:
+        futures = [executor.submit(simulate_user, app, recorder, number, args.rounds, args.seed)
+                   for number in numbers]
+        for future in futures:
+            future.result()
+    return dict(recorder.samples), FakeGeminiClient.calls, FakeGeminiClient.failures
+
+
+_forked = None
+
+
+def _run_forked(numbers):
+    from models import db
+
+    app, args = _forked
+    # Connections opened before the fork must not be shared with the parent
+    with app.app_context():
+        db.engine.dispose(close=False)
+    FakeGeminiClient.calls = FakeGeminiClient.failures = 0
+    return run_users(app, args, numbers)
+
+
+def run(args):
+    # Config reads the environment at import time, so configure it before
+    # the app is imported
+    workdir = tempfile.mkdtemp(prefix='quiz-bench-')
+    os.environ.update({
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+        'GEMINI_API_KEY': 'benchmark',
+        'SQL_QUERY_BUDGET_MODE': 'log',
+        'QUIZ_CACHE_POLICY': args.cache_policy,
+        'QUIZ_JOB_WORKERS': str(args.job_workers),
+        'QUIZ_JOB_MODE': args.job_mode,
+        'QUIZ_STREAMING': 'true' if args.streaming else 'false',
+        'QUIZ_POOL_SIZE': '0',
+        'METRICS_DIR': '',
+        'SQLITE_MODE': args.sqlite_mode,
+        'COMPRESS_ENABLED': 'true' if args.compression else 'false',
+    })
+
+    from google import genai
+    FakeGeminiClient.latency = args.latency
+    FakeGeminiClient.failure_rate = args.failure_rate
+    FakeGeminiClient.stream_break_rate = args.stream_break_rate
+    genai.Client = FakeGeminiClient
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app
+    app.logger.disabled = not args.verbose
+
+    groups = [list(range(args.users))[i::args.processes] for i in range(args.processes)]
+    started = time.perf_counter()
+    if args.processes == 1:
+        results = [run_users(app, args, groups[0])]
+    else:
+        # Children are forked after the schema exists, like preloaded gunicorn workers
+        global _forked
+        _forked = (app, args)
+        with multiprocessing.get_context('fork').Pool(args.processes) as pool:
+            results = pool.map(_run_forked, groups)
+    duration = time.perf_counter() - started
+
+    samples = defaultdict(list)
+    for process_samples, _, _ in results:
+        for name, values in process_samples.items():
+            samples[name].extend(values)
+    FakeGeminiClient.calls = sum(calls for _, calls, _ in results)
+    FakeGeminiClient.failures = sum(failures for _, _, failures in results)
+
+    endpoints = {}
+    for name, values in sorted(samples.items()):
+        latencies = [sample[0] for sample in values]
+        sql = [sample[2] for sample in values if sample[2] is not None]
+        endpoints[name] = {
+            'requests': len(values),
+            'errors': sum(1 for sample in values if sample[1] >= 500),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'ttfb_p50_ms': round(percentile([sample[3] for sample in values], 50) * 1000, 2),
+            'wire_kb': round(sum(sample[4] for sample in values) / len(values) / 1024, 2),
+            'body_kb': round(sum(sample[5] for sample in values) / len(values) / 1024, 2),
+            'sql_mean': round(sum(sql) / len(sql), 2) if sql else None,
+            'sql_max': max(sql) if sql else None,
+        }
+
+    total = sum(endpoint['requests'] for endpoint in endpoints.values())
+    return {
+        'commit': _git_commit(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'settings': {key: getattr(args, key) for key in ('users', 'processes', 'rounds', 'seed', 'latency',
+                                                         'failure_rate', 'stream_break_rate', 'cache_policy',
+                                                         'job_workers', 'job_mode', 'streaming', 'sqlite_mode',
+                                                         'compression')},
+        'duration_s': round(duration, 3),
+        'requests': total,
+        'requests_per_s': round(total / duration, 2) if duration else 0.0,
+        'wire_mb': round(sum(sample[4] for values in samples.values() for sample in values) / 1024 ** 2, 2),
+        'body_mb': round(sum(sample[5] for values in samples.values() for sample in values) / 1024 ** 2, 2),
+        'gemini_calls': FakeGeminiClient.calls,
+        'gemini_failures': FakeGeminiClient.failures,
+        'endpoints': endpoints,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report):
+    print(f"{report['requests']} requests in {report['duration_s']}s "
+          f"({report['requests_per_s']} req/s), {report['gemini_calls']} Gemini calls, "
+          f"{report['gemini_failures']} failed, {report['wire_mb']} MB sent ({report['body_mb']} MB uncompressed)")
+    print(f"{'endpoint':<28}{'reqs':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttfb ms':>10}"
+          f"{'wire KB':>9}{'body KB':>9}{'sql avg':>9}{'sql max':>9}")
+    for name, stats in report['endpoints'].items():
+        print(f"{name:<28}{stats['requests']:>7}{stats['errors']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['ttfb_p50_ms']:>10}{stats['wire_kb']:>9}{stats['body_kb']:>9}"
+              f"{str(stats['sql_mean']):>9}{str(stats['sql_max']):>9}")
+
+
+def compare(report, baseline, tolerance):
+    """Print per-endpoint changes against a baseline and return the regressions found"""
+    regressions = []
+    base_rate = baseline.get('requests_per_s') or 0
+    if base_rate and report['requests_per_s'] < base_rate * (1 - tolerance):
+        regressions.append(f"throughput {base_rate} -> {report['requests_per_s']} req/s")
+
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('created_at')}):")
+    if baseline.get('settings') != report['settings']:
+        print(f"Warning: baseline was run with different settings {baseline.get('settings')}")
+    for name, stats in report['endpoints'].items():
+        old = baseline.get('endpoints', {}).get(name)
+        if not old:
+            continue
+        change = (stats['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0.0
+        print(f"{name:<28} p95 {old['p95_ms']:>8} -> {stats['p95_ms']:>8} ms ({change:+.0%}), "
+              f"sql {old['sql_mean']} -> {stats['sql_mean']}")
+        if change > tolerance:
+            regressions.append(f"{name} p95 {old['p95_ms']} -> {stats['p95_ms']} ms")
+        if old['sql_mean'] is not None and stats['sql_mean'] is not None and stats['sql_mean'] > old['sql_mean']:
+            regressions.append(f"{name} SQL {old['sql_mean']} -> {stats['sql_mean']} statements")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline load benchmark for the quiz flow')
+    parser.add_argument('--users', type=int, default=8, help='Concurrent simulated users')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Worker processes sharing the database, like gunicorn workers')
+    parser.add_argument('--rounds', type=int, default=5, help='Quizzes each user creates and submits')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for topics and answers')
+    parser.add_argument('--latency', type=float, default=0.2, help='Fake Gemini latency in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of Gemini calls that fail')
+    parser.add_argument('--stream-break-rate', type=float, default=0.0,
+                        help='Fraction of Gemini streams that break halfway')
+    parser.add_argument('--cache-policy', default='reuse', choices=['off', 'reuse', 'mix'])
+    parser.add_argument('--job-workers', type=int, default=2, help='0 generates inside the request')
+    parser.add_argument('--job-mode', default='threads', choices=['threads', 'async'])
+    parser.add_argument('--sqlite-mode', default='default', choices=['default', 'wal'])
+    parser.add_argument('--no-streaming', dest='streaming', action='store_false')
+    parser.add_argument('--no-compression', dest='compression', action='store_false',
+                        help='Send responses uncompressed (COMPRESS_ENABLED=false)')
+    parser.add_argument('--save', metavar='PATH', help='Write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='Compare against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed p95/throughput regression before exiting non-zero')
+    parser.add_argument('--verbose', action='store_true', help='Keep the app log enabled')
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    print_report(report)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nSaved baseline to {args.save}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print('\nRegressions:')
+            for regression in regressions:
+                print(f'  {regression}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import insert
+from answer_key import answer_keys, valid_answers
+from models import QuizResult, User, UserStats, db
+
+
+def grade_submissions(submissions, save=True, batch_size=1000):
+    """Grade many (user, quiz, answers) submissions at once.
+
+    Each submission is a dict with ``user_id``, ``quiz_id`` and ``answers``
+    (a {question_id: option} dict or a sequence/string of options in
+    question order). Every distinct quiz's answer key is loaded once,
+    answers are packed to one byte per question and compared against the
+    key in a single integer XOR, and results are written with batched
+    executemany inserts plus one stats update per user.
+
+    Returns ``(graded, errors)``: a list of per-submission score dicts and
+    a list of ``{'index', 'message'}`` dicts for rejected submissions.
+    """
+    submissions = list(submissions)
+    keys = {}
+    for quiz_id in {s.get('quiz_id') for s in submissions}:
+        key = answer_keys.get(quiz_id) if isinstance(quiz_id, int) else None
+        if key is not None and key.complete and len(key):
+            keys[quiz_id] = key
+
+    user_ids = {s.get('user_id') for s in submissions if isinstance(s.get('user_id'), int)}
+    known_users = {uid for (uid,) in db.session.query(User.id).filter(User.id.in_(user_ids))} if user_ids else set()
+
+    graded = []
+    errors = []
+    rows = []
+    scores = defaultdict(lambda: defaultdict(list))
+    now = datetime.utcnow()
+
+    for index, submission in enumerate(submissions):
+        key = keys.get(submission.get('quiz_id'))
+        user_id = submission.get('user_id')
+        if key is None:
+            errors.append({'index': index, 'message': f"Unknown or incomplete quiz {submission.get('quiz_id')}"})
+            continue
+        if user_id not in known_users:
+            errors.append({'index': index, 'message': f'Unknown user {user_id}'})
+            continue
+
+        answers = submission.get('answers') or {}
+        if not valid_answers(answers):
+            errors.append({'index': index, 'message': 'Answers must be options given as strings'})
+            continue
+
+        packed = key.pack(answers)
+        score = key.score_packed(packed)
+        graded.append({'index': index, 'user_id': user_id, 'quiz_id': key.quiz_id,
+                       'score': score, 'total': len(key)})
+
+        if save:
+            rows.append({'user_id': user_id, 'quiz_id': key.quiz_id, 'score': score,
+                         'user_answers': packed.decode('ascii'), 'taken_at': now})
+            scores[user_id][key.difficulty].append(score)
+
+    if save and rows:
+        try:
+            # Stats first: a user without a stats row is rebuilt from history,
+            # which must not include the rows inserted below
+            for user_id, by_difficulty in scores.items():
+                UserStats.record_many(user_id, by_difficulty)
+            for start in range(0, len(rows), batch_size):
+                db.session.execute(insert(QuizResult), rows[start:start + batch_size])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    return graded, errors
@@ -0,0 +1,155 @@
+import json
+import click
+from sqlalchemy import update
+from models import QuizResult, User, UserStats, create_missing_indexes, db
+
+
+def init_database():
+    """Create missing tables and indexes and the question bank's full-text table"""
+    from question_bank import question_bank
+    db.create_all()
+    create_missing_indexes()
+    question_bank.create_schema()
+
+
+def register_commands(app):
+    """Attach the app's maintenance commands to ``flask``"""
+
+    @app.cli.command('init-db')
+    def init_db():
+        """Create the schema; run once per deploy when STARTUP_MODE=fast"""
+        init_database()
+        click.echo('Database schema is up to date')
+
+    @app.cli.command('rebuild-stats')
+    @click.option('--user-id', type=int, help='Only rebuild this user')
+    def rebuild_stats(user_id):
+        """Rebuild the per-user stats rollup from quiz history"""
+        user_ids = [user_id] if user_id else [uid for (uid,) in db.session.query(User.id)]
+        for uid in user_ids:
+            UserStats.rebuild(uid)
+            db.session.commit()
+        click.echo(f'Rebuilt stats for {len(user_ids)} user(s)')
+
+    @app.cli.command('grade-submissions')
+    @click.argument('path', type=click.File('r'))
+    @click.option('--dry-run', is_flag=True, help='Grade without saving results')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def grade_submissions_command(path, dry_run, batch_size):
+        """Grade a JSON list of {user_id, quiz_id, answers} submissions"""
+        from bulk_grading import grade_submissions
+        graded, errors = grade_submissions(json.load(path), save=not dry_run, batch_size=batch_size)
+        for error in errors:
+            click.echo(f"Submission {error['index']}: {error['message']}", err=True)
+        click.echo(f'Graded {len(graded)} submission(s), {len(errors)} rejected')
+
+    @app.cli.command('export-history')
+    @click.argument('user_id', type=int)
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+    @click.option('--gzip', 'compress', is_flag=True, help='Gzip the output')
+    @click.option('--output', '-o', type=click.File('wb'), default='-', help='Output file (default stdout)')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def export_history_command(user_id, fmt, compress, output, batch_size):
+        """Stream a user's quiz history as CSV or NDJSON"""
+        from export import export_history, gzipped
+        chunks = export_history(user_id, fmt, batch_size=batch_size)
+        for chunk in gzipped(chunks) if compress else chunks:
+            output.write(chunk)
+
+    @app.cli.command('export-quizzes')
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+    @click.option('--gzip', 'compress', is_flag=True, help='Gzip the output')
+    @click.option('--output', '-o', type=click.File('wb'), default='-', help='Output file (default stdout)')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def export_quizzes_command(fmt, compress, output, batch_size):
+        """Stream every quiz with its questions as CSV or NDJSON"""
+        from export import export_quizzes, gzipped
+        chunks = export_quizzes(fmt, batch_size=batch_size)
+        for chunk in gzipped(chunks) if compress else chunks:
+            output.write(chunk)
+
+    @app.cli.command('import-questions')
+    @click.argument('path', type=click.File('rb'))
+    @click.option('--format', 'fmt', type=click.Choice(['json', 'csv']),
+                  help='Input format (default: from the file extension; json also reads NDJSON)')
+    @click.option('--name', help='Import name used to resume (default: the file path)')
+    @click.option('--restart', is_flag=True, help='Start over instead of resuming a previous run')
+    @click.option('--batch-size', default=2000, show_default=True, help='Questions inserted per transaction')
+    def import_questions_command(path, fmt, name, restart, batch_size):
+        """Bulk import quizzes from a JSON array, NDJSON or CSV file"""
+        import os
+        from question_import import import_quizzes, read_quizzes
+        fmt = fmt or ('csv' if path.name.lower().endswith('.csv') else 'json')
+        name = name or (os.path.abspath(path.name) if path.name != '<stdin>' else None)
+        summary = import_quizzes(read_quizzes(path, fmt), name=name, batch_size=batch_size, restart=restart)
+        for error in summary['errors']:
+            click.echo(f"Quiz {error['quiz']}: {error['message']}", err=True)
+        if summary['resumed_from']:
+            click.echo(f"Resumed after {summary['resumed_from']} quiz(zes) already read")
+        click.echo(f"Imported {summary['quizzes_imported']} quiz(zes) with {summary['questions_imported']} "
+                   f"question(s), {summary['rejected']} rejected")
+        if not summary['complete']:
+            raise click.ClickException(f"Stopped before the end of the file; run again to resume '{summary['name']}'")
+
+    @app.cli.command('build-static')
+    def build_static():
+        """Minify, fingerprint and precompress everything in static/"""
+        from static_assets import static_assets
+        for source, target in static_assets.build(force=True).items():
+            click.echo(f'{source} -> {target}')
+
+    @app.cli.command('compile-templates')
+    def compile_templates():
+        """Compile every template into the Jinja bytecode cache"""
+        if app.jinja_env.bytecode_cache is None:
+            raise click.ClickException('The template cache is disabled (TEMPLATE_CACHE_DIR is not writable)')
+        names = app.jinja_env.list_templates()
+        for name in names:
+            app.jinja_env.get_template(name)
+        click.echo(f'Compiled {len(names)} template(s)')
+
+    @app.cli.command('compact-answers')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def compact_answers(batch_size):
+        """Rewrite legacy JSON quiz answers in the packed one-letter-per-question form"""
+        from answer_key import answer_keys
+        converted = skipped = 0
+        last_id = 0
+        while True:
+            rows = db.session.query(QuizResult.id, QuizResult.quiz_id, QuizResult.user_answers)\
+                             .filter(QuizResult.id > last_id, QuizResult.user_answers.like('{%'))\
+                             .order_by(QuizResult.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            updates = []
+            for row in rows:
+                key = answer_keys.get(row.quiz_id)
+                if key is None or not len(key):
+                    # Results of a deleted quiz keep their JSON, which still decodes
+                    skipped += 1
+                    continue
+                updates.append({'id': row.id, 'user_answers': key.encode(json.loads(row.user_answers))})
+            if updates:
+                db.session.execute(update(QuizResult), updates)
+            db.session.commit()
+            converted += len(updates)
+        click.echo(f'Compacted {converted} result(s), skipped {skipped} without a quiz')
+
+    @app.cli.command('aggregate-analytics')
+    @click.option('--rebuild', is_flag=True, help='Drop the rollups and aggregate all results again')
+    def aggregate_analytics(rebuild):
+        """Fold new quiz results into the leaderboards and question stats"""
+        from analytics import analytics
+        processed = analytics.rebuild() if rebuild else analytics.catch_up()
+        click.echo(f'Aggregated {processed} result(s)')
+
+    @app.cli.command('rebuild-question-bank')
+    def rebuild_question_bank():
+        """Re-index every stored question in the full-text question bank"""
+        from question_bank import question_bank
+        if not question_bank.enabled:
+            raise click.ClickException('The question bank needs SQLite and QUESTION_BANK_ENABLED=true')
+        question_bank.create_schema()
+        click.echo(f'Indexed {question_bank.rebuild()} question(s)')
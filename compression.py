@@ -0,0 +1,112 @@
+import gzip
+import zlib
+from flask import Response, g, get_flashed_messages, request, stream_template
+
+DEFAULT_MIMETYPES = ('text/html', 'application/json', 'text/plain', 'application/x-ndjson', 'text/csv')
+# Streamed pages are flushed to the client in pieces of at least this many bytes
+STREAM_CHUNK_SIZE = 8192
+
+
+class Compression:
+    """gzip for HTML and JSON responses, applied after every request.
+
+    Buffered responses are compressed in one go once they reach
+    COMPRESS_MIN_SIZE bytes. Streamed ones (``stream_page``) are compressed
+    chunk by chunk with a sync flush after each, so the browser can start
+    on the top of a page while the rest is still being rendered.
+    Responses that already carry a Content-Encoding (fingerprinted assets,
+    ``?gzip=1`` exports) or send files are left alone.
+
+    Compression changes the bytes but not the meaning of a response, so a
+    strong ETag is sent as a weak one, as nginx does, and conditional views
+    compare ETags weakly.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.min_size = 500
+        self.level = 6
+        self.mimetypes = frozenset(DEFAULT_MIMETYPES)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('COMPRESS_ENABLED', True)
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', 500)
+        self.level = app.config.get('COMPRESS_LEVEL', 6)
+        self.mimetypes = frozenset(app.config.get('COMPRESS_MIMETYPES') or DEFAULT_MIMETYPES)
+        if self.enabled:
+            app.after_request(self.compress)
+
+    def compress(self, response):
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.direct_passthrough or 'Content-Encoding' in response.headers
+                or response.mimetype not in self.mimetypes):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if request.method == 'HEAD' or not request.accept_encodings['gzip']:
+            return response
+
+        if response.is_streamed:
+            response.response = self._stream(response.iter_encoded(), response.response)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            response.set_data(gzip.compress(data, self.level))
+
+        response.headers['Content-Encoding'] = 'gzip'
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _stream(self, chunks, source):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        try:
+            for chunk in chunks:
+                data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            if hasattr(source, 'close'):
+                source.close()
+
+
+def _coalesce(pieces, size=STREAM_CHUNK_SIZE):
+    """Join Jinja's many small output fragments into chunks worth a network write"""
+    buffer = []
+    buffered = 0
+    try:
+        for piece in pieces:
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered >= size:
+                yield ''.join(buffer)
+                buffer = []
+                buffered = 0
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        # Releases the request context stream_template keeps open
+        pieces.close()
+
+
+def stream_page(template_name, **context):
+    """Render a template as a streamed HTML response instead of building it in memory.
+
+    The template renders after the ``after_request`` hooks have run, so
+    ``g.streamed_page`` tells the query budget and request metrics to
+    settle up when the response is closed instead.
+    """
+    # The session cookie goes out before the page renders, so flashed
+    # messages are popped now; the template's call reads them from the request
+    get_flashed_messages()
+    g.streamed_page = True
+    return Response(_coalesce(stream_template(template_name, **context)), mimetype='text/html')
+
+
+compression = Compression()
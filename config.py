@@ -11,7 +11,119 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'instance', 'site.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # 'wal' enables WAL and tuned pragmas, a single serialized writer and a
+    # read-only connection pool for SELECTs; 'default' leaves SQLite as is
+    SQLITE_MODE = os.environ.get('SQLITE_MODE', 'default')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'))
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '20000'))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', '268435456'))
+    SQLITE_READ_POOL_SIZE = int(os.environ.get('SQLITE_READ_POOL_SIZE', '10'))
+    
+    # Usernames allowed to use admin-only endpoints (comma separated)
+    ADMIN_USERS = [name.strip() for name in os.environ.get('ADMIN_USERS', '').split(',') if name.strip()]
+    
     # AI Configuration
     GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
+    
+    # Shared Gemini client: per-attempt timeout and overall deadline in seconds,
+    # retries with jittered backoff, circuit breaker and optional hedging (0 = off)
+    GEMINI_TIMEOUT = float(os.environ.get('GEMINI_TIMEOUT', '20'))
+    GEMINI_DEADLINE = float(os.environ.get('GEMINI_DEADLINE', '45'))
+    GEMINI_MAX_RETRIES = int(os.environ.get('GEMINI_MAX_RETRIES', '2'))
+    GEMINI_BACKOFF = float(os.environ.get('GEMINI_BACKOFF', '0.5'))
+    GEMINI_BREAKER_THRESHOLD = int(os.environ.get('GEMINI_BREAKER_THRESHOLD', '5'))
+    GEMINI_BREAKER_COOLDOWN = int(os.environ.get('GEMINI_BREAKER_COOLDOWN', '30'))
+    GEMINI_HEDGE_AFTER = float(os.environ.get('GEMINI_HEDGE_AFTER', '0'))
+    GEMINI_MAX_CONCURRENCY = int(os.environ.get('GEMINI_MAX_CONCURRENCY', '16'))
     # App Settings
-    QUIZ_QUESTIONS_COUNT = int(os.environ.get('QUIZ_QUESTIONS_COUNT', '10'))
\ No newline at end of file
+    QUIZ_QUESTIONS_COUNT = int(os.environ.get('QUIZ_QUESTIONS_COUNT', '10'))
+    
+    # Quiz cache: 'reuse' serves the cached quiz, 'mix' builds a new quiz
+    # from the cached quizzes' questions, 'off' always calls Gemini
+    QUIZ_CACHE_POLICY = os.environ.get('QUIZ_CACHE_POLICY', 'reuse')
+    QUIZ_CACHE_TTL = int(os.environ.get('QUIZ_CACHE_TTL', '3600'))
+    QUIZ_CACHE_MAX_REUSE = int(os.environ.get('QUIZ_CACHE_MAX_REUSE', '20'))
+    QUIZ_CACHE_MAX_ENTRIES = int(os.environ.get('QUIZ_CACHE_MAX_ENTRIES', '500'))
+    # Reuse an existing topic at least this similar to the requested one (0 = off)
+    QUIZ_TOPIC_MATCH_THRESHOLD = float(os.environ.get('QUIZ_TOPIC_MATCH_THRESHOLD', '0.85'))
+    QUIZ_TOPIC_INDEX_REFRESH = int(os.environ.get('QUIZ_TOPIC_INDEX_REFRESH', '30'))
+    
+    # Full-text bank of generated questions used before asking Gemini (SQLite FTS5)
+    QUESTION_BANK_ENABLED = os.environ.get('QUESTION_BANK_ENABLED', 'true').lower() == 'true'
+    QUESTION_BANK_MIN_MATCHES = int(os.environ.get('QUESTION_BANK_MIN_MATCHES', '5'))
+    QUESTION_BANK_MAX_PER_QUIZ = int(os.environ.get('QUESTION_BANK_MAX_PER_QUIZ', '3'))
+    
+    # Leaderboard and question stats rollups (0 interval = only via `flask aggregate-analytics`)
+    ANALYTICS_INTERVAL = int(os.environ.get('ANALYTICS_INTERVAL', '10'))
+    ANALYTICS_BATCH_SIZE = int(os.environ.get('ANALYTICS_BATCH_SIZE', '5000'))
+    LEADERBOARD_MAX_SIZE = int(os.environ.get('LEADERBOARD_MAX_SIZE', '100'))
+    
+    # Background quiz generation (0 workers generates inside the request)
+    QUIZ_JOB_WORKERS = int(os.environ.get('QUIZ_JOB_WORKERS', '2'))
+    QUIZ_JOB_QUEUE_MAX = int(os.environ.get('QUIZ_JOB_QUEUE_MAX', '50'))
+    QUIZ_JOB_STALE_SECONDS = int(os.environ.get('QUIZ_JOB_STALE_SECONDS', '300'))
+    # 'threads' runs one generation per worker; 'async' runs them on one event loop
+    QUIZ_JOB_MODE = os.environ.get('QUIZ_JOB_MODE', 'threads').lower()
+    QUIZ_ASYNC_MAX_INFLIGHT = int(os.environ.get('QUIZ_ASYNC_MAX_INFLIGHT', '200'))
+    # Stream Gemini output in background jobs so the quiz opens after the first question
+    QUIZ_STREAMING = os.environ.get('QUIZ_STREAMING', 'true').lower() == 'true'
+    
+    # Warm pool of pre-generated quizzes for the most requested topics
+    QUIZ_POOL_SIZE = int(os.environ.get('QUIZ_POOL_SIZE', '2'))
+    QUIZ_POOL_TOP_K = int(os.environ.get('QUIZ_POOL_TOP_K', '10'))
+    QUIZ_POOL_WINDOW_HOURS = int(os.environ.get('QUIZ_POOL_WINDOW_HOURS', '24'))
+    QUIZ_POOL_CONCURRENCY = int(os.environ.get('QUIZ_POOL_CONCURRENCY', '2'))
+    QUIZ_POOL_HOURLY_BUDGET = int(os.environ.get('QUIZ_POOL_HOURLY_BUDGET', '20'))
+    QUIZ_POOL_INTERVAL = int(os.environ.get('QUIZ_POOL_INTERVAL', '60'))
+    QUIZ_POOL_OFFPEAK_HOURS = os.environ.get('QUIZ_POOL_OFFPEAK_HOURS', '')
+    
+    # Browser/proxy caching of finished quizzes' question API (seconds);
+    # 'public' lets shared caches serve it without going through login
+    QUIZ_HTTP_MAX_AGE = int(os.environ.get('QUIZ_HTTP_MAX_AGE', '86400'))
+    QUIZ_HTTP_CACHE_PUBLIC = os.environ.get('QUIZ_HTTP_CACHE_PUBLIC', 'false').lower() == 'true'
+    
+    # Logged-in user identities cached by the user_loader (TTL in seconds)
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '300'))
+    
+    # Answer keys of finished quizzes kept in memory for scoring and results
+    ANSWER_KEY_CACHE_SIZE = int(os.environ.get('ANSWER_KEY_CACHE_SIZE', '1000'))
+    
+    # Bulk grading
+    BULK_GRADE_MAX_SUBMISSIONS = int(os.environ.get('BULK_GRADE_MAX_SUBMISSIONS', '50000'))
+    BULK_GRADE_BATCH_SIZE = int(os.environ.get('BULK_GRADE_BATCH_SIZE', '1000'))
+    
+    # Rows fetched per query while streaming CSV/NDJSON exports
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+    
+    # Questions inserted per transaction by bulk question imports
+    QUESTION_IMPORT_BATCH_SIZE = int(os.environ.get('QUESTION_IMPORT_BATCH_SIZE', '2000'))
+    
+    # 'fast' skips schema creation at startup (run `flask init-db` on deploy
+    # instead); compiled templates are cached in TEMPLATE_CACHE_DIR
+    # (default instance/jinja-cache)
+    STARTUP_MODE = os.environ.get('STARTUP_MODE', 'default').lower()
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')
+    
+    # Minified, fingerprinted and precompressed static files under /assets
+    # (built at startup into STATIC_BUILD_DIR, default instance/assets)
+    STATIC_ASSETS_ENABLED = os.environ.get('STATIC_ASSETS_ENABLED', 'true').lower() == 'true'
+    STATIC_BUILD_DIR = os.environ.get('STATIC_BUILD_DIR')
+    
+    # gzip for responses of these types once they reach COMPRESS_MIN_SIZE bytes
+    # (empty mimetypes = HTML, JSON, plain text, CSV and NDJSON)
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '500'))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', '6'))
+    COMPRESS_MIMETYPES = [mimetype.strip() for mimetype in os.environ.get('COMPRESS_MIMETYPES', '').split(',')
+                          if mimetype.strip()]
+    
+    # Per-request SQL statement budgets: 'off', 'log' or 'raise' (for tests)
+    SQL_QUERY_BUDGET_MODE = os.environ.get('SQL_QUERY_BUDGET_MODE', 'off')
+    
+    # Prometheus metrics at /metrics, served only with METRICS_TOKEN outside
+    # debug mode; set METRICS_DIR to merge gunicorn workers
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
@@ -0,0 +1,129 @@
+import csv
+import io
+import json
+import zlib
+from answer_key import answer_keys
+from models import Question, Quiz, QuizResult, db
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+HISTORY_FIELDS = ('result_id', 'taken_at', 'quiz_id', 'topic', 'difficulty', 'score', 'answers')
+QUESTION_FIELDS = ('question_number', 'question_text', 'option_a', 'option_b', 'option_c', 'option_d',
+                   'correct_option', 'explanation')
+QUIZ_FIELDS = ('quiz_id', 'topic', 'difficulty', 'created_at')
+
+
+def _batches(query, keyset, batch_size):
+    """Keyset-paginate ``query`` in ``keyset`` column order; rows must expose those columns by name.
+
+    Each batch is a short query seeking on an index, so no cursor (or
+    SQLite read lock) stays open while the client downloads, and the
+    last batch costs the same as the first.
+    """
+    names = [column.key for column in keyset]
+    last = None
+    while True:
+        page = query
+        if last is not None:
+            page = page.filter(db.tuple_(*keyset) > last if len(keyset) > 1 else keyset[0] > last[0])
+        rows = page.order_by(*keyset).limit(batch_size).all()
+        if not rows:
+            return
+        yield rows
+        last = tuple(getattr(rows[-1], name) for name in names)
+
+
+def _encode(records, fmt, fields):
+    """Encode batches of row dicts as CSV (with a header) or NDJSON, one bytes chunk per batch"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        yield buffer.getvalue().encode('utf-8')
+        for batch in records:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(batch)
+            yield buffer.getvalue().encode('utf-8')
+    else:
+        for batch in records:
+            yield ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in batch).encode('utf-8')
+
+
+def gzipped(chunks, level=6):
+    """Compress a stream of bytes chunks into one gzip stream as it is produced"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _stored_answers(row):
+    # Results saved before `flask compact-answers` still hold JSON
+    if not row.user_answers.startswith('{'):
+        return row.user_answers
+    key = answer_keys.get(row.quiz_id)
+    return key.encode(json.loads(row.user_answers)) if key is not None else row.user_answers
+
+
+def export_history(user_id, fmt='csv', batch_size=1000):
+    """Yield a user's quiz results, oldest first, as encoded chunks.
+
+    Pages through the (user_id, taken_at, id) history index.
+    """
+    query = db.session.query(QuizResult.id, QuizResult.taken_at, QuizResult.quiz_id, QuizResult.score,
+                             QuizResult.user_answers, Quiz.topic, Quiz.difficulty)\
+                      .join(Quiz, Quiz.id == QuizResult.quiz_id)\
+                      .filter(QuizResult.user_id == user_id)
+
+    def records():
+        for rows in _batches(query, (QuizResult.taken_at, QuizResult.id), batch_size):
+            yield [{
+                'result_id': row.id,
+                'taken_at': row.taken_at.isoformat() if row.taken_at else None,
+                'quiz_id': row.quiz_id,
+                'topic': row.topic,
+                'difficulty': row.difficulty,
+                'score': row.score,
+                'answers': _stored_answers(row)
+            } for row in rows]
+
+    return _encode(records(), fmt, HISTORY_FIELDS)
+
+
+def export_quizzes(fmt='csv', batch_size=1000):
+    """Yield every quiz with its questions as encoded chunks.
+
+    CSV has one row per question with the quiz columns repeated; NDJSON has
+    one line per quiz with a ``questions`` list.
+    """
+    query = db.session.query(Quiz.id, Quiz.topic, Quiz.difficulty, Quiz.created_at)
+    question_columns = [getattr(Question, field) for field in QUESTION_FIELDS]
+
+    def records():
+        for quizzes in _batches(query, (Quiz.id,), batch_size):
+            questions = {}
+            rows = db.session.query(Question.quiz_id, *question_columns)\
+                             .filter(Question.quiz_id.between(quizzes[0].id, quizzes[-1].id))\
+                             .order_by(Question.quiz_id, Question.question_number)
+            for row in rows:
+                questions.setdefault(row.quiz_id, []).append({field: getattr(row, field) for field in QUESTION_FIELDS})
+
+            batch = []
+            for quiz in quizzes:
+                record = {
+                    'quiz_id': quiz.id,
+                    'topic': quiz.topic,
+                    'difficulty': quiz.difficulty,
+                    'created_at': quiz.created_at.isoformat() if quiz.created_at else None
+                }
+                if fmt == 'csv':
+                    batch.extend(dict(record, **question) for question in questions.get(quiz.id, []))
+                else:
+                    batch.append(dict(record, questions=questions.get(quiz.id, [])))
+            yield batch
+
+    return _encode(records(), fmt, QUIZ_FIELDS + QUESTION_FIELDS)
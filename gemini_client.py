@@ -0,0 +1,299 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from metrics import metrics
+
+PLACEHOLDER_KEYS = ('your-new-api-key-here', 'your-gemini-api-key-here')
+
+
+class GeminiUnavailable(Exception):
+    """Raised without calling Gemini when the circuit is open or the call deadline has passed"""
+
+
+class CircuitBreaker:
+    """Open after ``threshold`` consecutive failures and let one trial call through per cooldown"""
+
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'half-open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # Half-open: restart the cooldown so only this caller tries
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.threshold and self.failures >= self.threshold:
+                if self.opened_at is None:
+                    metrics.inc('gemini_circuit_opened_total')
+                self.opened_at = time.monotonic()
+
+
+class GeminiClient:
+    """Process-wide Gemini client shared by every quiz generator.
+
+    One ``genai.Client`` (and so one HTTP connection pool) is created per
+    process. Calls get a per-attempt HTTP timeout, an overall deadline,
+    jittered exponential backoff between attempts and a circuit breaker
+    that fails fast while the provider is down. With GEMINI_HEDGE_AFTER set,
+    a second identical request is sent when the first is slow and whichever
+    answers first wins.
+    """
+
+    def __init__(self, app=None):
+        self.api_key = None
+        self.timeout = 20
+        self.deadline = 45
+        self.max_retries = 2
+        self.backoff = 0.5
+        self.hedge_after = 0
+        self.max_concurrency = 16
+        self.breaker = CircuitBreaker()
+        self._client = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.api_key = app.config.get('GEMINI_API_KEY')
+        self.timeout = app.config.get('GEMINI_TIMEOUT', 20)
+        self.deadline = app.config.get('GEMINI_DEADLINE', 45)
+        self.max_retries = app.config.get('GEMINI_MAX_RETRIES', 2)
+        self.backoff = app.config.get('GEMINI_BACKOFF', 0.5)
+        self.hedge_after = app.config.get('GEMINI_HEDGE_AFTER', 0)
+        self.max_concurrency = app.config.get('GEMINI_MAX_CONCURRENCY', 16)
+        self.breaker = CircuitBreaker(app.config.get('GEMINI_BREAKER_THRESHOLD', 5),
+                                      app.config.get('GEMINI_BREAKER_COOLDOWN', 30))
+        with self._lock:
+            self._pid = None
+
+    @property
+    def available(self):
+        return bool(self.api_key) and self.api_key not in PLACEHOLDER_KEYS
+
+    def _ensure_client(self):
+        """Create the shared client and call executor once per process"""
+        with self._lock:
+            # Neither the HTTP pool nor executor threads survive a fork
+            if self._pid != os.getpid():
+                # Imported on first use, google.genai alone takes a few hundred ms
+                from google import genai
+                from google.genai import types
+                self._client = genai.Client(
+                    api_key=self.api_key,
+                    http_options=types.HttpOptions(timeout=int(self.timeout * 1000))
+                )
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                    thread_name_prefix='gemini')
+                self._pid = os.getpid()
+            return self._client
+
+    def stats(self):
+        return {'available': self.available, 'circuit': self.breaker.state,
+                'consecutive_failures': self.breaker.failures}
+
+    def generate(self, model, contents):
+        """Return the ``generate_content`` response, retrying and hedging within the deadline"""
+        return self._with_retries(lambda deadline: self._hedged(model, contents, deadline))
+
+    def generate_stream(self, model, contents):
+        """Yield ``generate_content_stream`` chunks.
+
+        Only opening the stream (up to the first chunk) is retried; an error
+        after chunks were handed out is raised to the caller.
+        """
+        deadline = time.monotonic() + self.deadline
+
+        def open_stream(_):
+            stream = iter(self._ensure_client().models.generate_content_stream(model=model, contents=contents))
+            return stream, next(stream, None)
+
+        stream, first = self._with_retries(open_stream)
+        try:
+            if first is not None:
+                yield first
+            for chunk in stream:
+                if time.monotonic() > deadline:
+                    raise GeminiUnavailable(f'Gemini stream exceeded its {self.deadline}s deadline')
+                yield chunk
+        except Exception:
+            self.breaker.failure()
+            raise
+
+    def _admit(self):
+        if not self.available:
+            raise GeminiUnavailable('Gemini API key is not configured')
+        if not self.breaker.allow():
+            metrics.inc('gemini_circuit_rejected_total')
+            raise GeminiUnavailable('Gemini circuit is open after repeated failures')
+        return self._ensure_client()
+
+    def _next_delay(self, attempt, deadline):
+        """Jittered backoff before the next attempt, or None when no attempt is left"""
+        delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+        if attempt == self.max_retries or time.monotonic() + delay >= deadline or self.breaker.state == 'open':
+            return None
+        metrics.inc('gemini_retries_total')
+        return delay
+
+    def _with_retries(self, call):
+        self._admit()
+        deadline = time.monotonic() + self.deadline
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = call(deadline)
+                self.breaker.success()
+                return result
+            except Exception as e:
+                self.breaker.failure()
+                error = e
+
+            delay = self._next_delay(attempt, deadline)
+            if delay is None:
+                break
+            time.sleep(delay)
+        raise error
+
+    def _hedged(self, model, contents, deadline):
+        def call():
+            return self._client.models.generate_content(model=model, contents=contents)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise GeminiUnavailable(f'Gemini call exceeded its {self.deadline}s deadline')
+
+        pending = {self._executor.submit(call)}
+        if self.hedge_after and self.hedge_after < remaining:
+            done, pending = wait(pending, timeout=self.hedge_after)
+            if not done:
+                metrics.inc('gemini_hedges_total')
+                pending.add(self._executor.submit(call))
+            pending |= done
+
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                # Abandoned calls finish in the background, bounded by the HTTP timeout
+                raise GeminiUnavailable(f'Gemini call exceeded its {self.deadline}s deadline')
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    # -- asyncio -----------------------------------------------------------
+
+    async def agenerate(self, model, contents):
+        """Async ``generate`` on the client's aio API, with the same retries, hedging and breaker"""
+        client = self._admit()
+        deadline = time.monotonic() + self.deadline
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await self._ahedged(client, model, contents, deadline)
+                self.breaker.success()
+                return result
+            except Exception as e:
+                self.breaker.failure()
+                error = e
+
+            delay = self._next_delay(attempt, deadline)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+        raise error
+
+    async def agenerate_stream(self, model, contents):
+        """Async ``generate_stream``; only opening the stream is retried"""
+        client = self._admit()
+        deadline = time.monotonic() + self.deadline
+        for attempt in range(self.max_retries + 1):
+            try:
+                remaining = max(0, deadline - time.monotonic())
+                stream = await asyncio.wait_for(
+                    client.aio.models.generate_content_stream(model=model, contents=contents), remaining)
+                first = await asyncio.wait_for(anext(stream, None), max(0, deadline - time.monotonic()))
+                self.breaker.success()
+                break
+            except Exception as e:
+                self.breaker.failure()
+                error = e
+
+            delay = self._next_delay(attempt, deadline)
+            if delay is None:
+                raise error
+            await asyncio.sleep(delay)
+
+        try:
+            if first is not None:
+                yield first
+            async for chunk in stream:
+                if time.monotonic() > deadline:
+                    raise GeminiUnavailable(f'Gemini stream exceeded its {self.deadline}s deadline')
+                yield chunk
+        except Exception:
+            self.breaker.failure()
+            raise
+
+    async def _ahedged(self, client, model, contents, deadline):
+        def call():
+            return asyncio.ensure_future(client.aio.models.generate_content(model=model, contents=contents))
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise GeminiUnavailable(f'Gemini call exceeded its {self.deadline}s deadline')
+
+        pending = {call()}
+        try:
+            if self.hedge_after and self.hedge_after < remaining:
+                done, pending = await asyncio.wait(pending, timeout=self.hedge_after)
+                if not done:
+                    metrics.inc('gemini_hedges_total')
+                    pending.add(call())
+                pending |= done
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0, deadline - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise GeminiUnavailable(f'Gemini call exceeded its {self.deadline}s deadline')
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Unlike threads, losing or timed-out requests can be cancelled
+            for task in pending:
+                task.cancel()
+
+
+gemini = GeminiClient()
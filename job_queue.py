@@ -0,0 +1,285 @@
+import asyncio
+import functools
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from models import QuizJob, db
+
+JOB_MODES = ('threads', 'async')
+
+
+class QueueFullError(Exception):
+    """Raised when the quiz generation queue is at its configured depth"""
+
+
+class JobQueue:
+    """Local worker pool that runs quiz generation outside the request.
+
+    Jobs are persisted in the ``quiz_jobs`` table, which is the source of
+    truth: the in-memory queue only wakes workers up. Workers claim a job
+    with a conditional UPDATE so several processes (e.g. gunicorn workers)
+    can share the table, and a periodic sweep re-queues jobs that were
+    queued by another process or left running by a crashed one.
+
+    In 'async' mode a single event loop thread runs up to
+    QUIZ_ASYNC_MAX_INFLIGHT generations at once on the async Gemini client,
+    and the worker threads only do the short database writes.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.workers = 0
+        self.max_depth = 0
+        self.stale_after = 300
+        self.sweep_interval = 5
+        self.stream = False
+        self.mode = 'threads'
+        self.max_inflight = 200
+        self._queue = queue.Queue()
+        self._loop = None
+        self._wakeup = None
+        self._inflight = set()
+        self._db_executor = None
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('QUIZ_JOB_WORKERS', 2)
+        self.max_depth = app.config.get('QUIZ_JOB_QUEUE_MAX', 50)
+        self.stale_after = app.config.get('QUIZ_JOB_STALE_SECONDS', 300)
+        self.stream = app.config.get('QUIZ_STREAMING', True)
+        self.mode = app.config.get('QUIZ_JOB_MODE', 'threads')
+        if self.mode not in JOB_MODES:
+            app.logger.warning(f"Unknown QUIZ_JOB_MODE '{self.mode}', using threads")
+            self.mode = 'threads'
+        self.max_inflight = app.config.get('QUIZ_ASYNC_MAX_INFLIGHT', 200)
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def start(self):
+        """Start the worker threads once per process (safe to call repeatedly)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            # Threads do not survive a fork, so a preloaded gunicorn master
+            # must not count as "started" for its workers.
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self.max_depth or 0)
+            self._threads = []
+            if self.mode == 'async':
+                self._loop = None
+                self._db_executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='quiz-job-db')
+                thread = threading.Thread(target=self._run_loop, name='quiz-job-loop', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'quiz-job-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def depth(self):
+        """Number of jobs waiting across all processes sharing the database"""
+        return QuizJob.query.filter_by(status='queued').count()
+
+    def stats(self):
+        return {
+            'queued': self.depth(),
+            'running': QuizJob.query.filter_by(status='running').count(),
+            'max_depth': self.max_depth,
+            'workers': self.workers,
+            'mode': self.mode,
+            'local_queue': self._queue.qsize(),
+            'in_flight': len(self._inflight)
+        }
+
+    def submit(self, user_id, topic, difficulty):
+        """Persist a new job and hand it to the local workers"""
+        self.start()
+        if self.max_depth and self.depth() >= self.max_depth:
+            raise QueueFullError('Quiz generation queue is full, please try again shortly')
+
+        job = QuizJob(id=uuid.uuid4().hex, user_id=user_id, topic=topic, difficulty=difficulty)
+        db.session.add(job)
+        db.session.commit()
+        self._wake(job.id)
+        return job
+
+    def _wake(self, job_id):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+            return
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            # The row is still queued in the database; the sweep picks it up
+            pass
+
+    def _worker(self):
+        while True:
+            try:
+                job_id = self._queue.get(timeout=self.sweep_interval)
+            except queue.Empty:
+                job_id = None
+            with self.app.app_context():
+                try:
+                    if job_id:
+                        self.run_job(job_id)
+                    else:
+                        self._sweep()
+                except Exception as e:
+                    self.app.logger.error(f"Quiz job worker error: {e}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def _requeue_stale(self):
+        from ai_service import discard_quiz
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        stale = QuizJob.query.filter(QuizJob.status == 'running', QuizJob.updated_at < cutoff)
+        quiz_ids = [quiz_id for (quiz_id,) in stale.with_entities(QuizJob.quiz_id) if quiz_id]
+        stale.update({'status': 'queued', 'progress': 0, 'quiz_id': None}, synchronize_session=False)
+        db.session.commit()
+        # The retry generates a new quiz, so the dead worker's partially
+        # streamed one is deleted rather than left behind incomplete
+        for quiz_id in quiz_ids:
+            discard_quiz(quiz_id)
+
+    def _sweep(self):
+        """Re-queue stale running jobs and pick up jobs no local worker has seen"""
+        self._requeue_stale()
+
+        queued = QuizJob.query.with_entities(QuizJob.id).filter_by(status='queued')\
+                              .order_by(QuizJob.created_at).limit(self.workers).all()
+        for (job_id,) in queued:
+            self.run_job(job_id)
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = datetime.utcnow()
+        QuizJob.query.filter_by(id=job_id).update(fields, synchronize_session=False)
+        db.session.commit()
+
+    def _claim(self, job_id):
+        """Move a queued job to running; False if another worker got it first"""
+        claimed = QuizJob.query.filter_by(id=job_id, status='queued')\
+                               .update({'status': 'running', 'progress': 10, 'updated_at': datetime.utcnow()},
+                                       synchronize_session=False)
+        db.session.commit()
+        return bool(claimed)
+
+    def run_job(self, job_id):
+        """Claim a queued job and generate its quiz"""
+        from ai_service import AIQuizGenerator
+
+        if not self._claim(job_id):
+            return
+
+        def on_progress(quiz, number, total):
+            # Publishing quiz_id after the first question lets the user start
+            # the quiz while the rest is still streaming in
+            self._update(job_id, quiz_id=quiz.id, progress=10 + 90 * number // total)
+
+        job = db.session.get(QuizJob, job_id)
+        try:
+            quiz = AIQuizGenerator().generate_quiz(job.topic, job.difficulty, use_cache=False,
+                                                   stream=self.stream, on_progress=on_progress)
+            if not quiz:
+                raise RuntimeError('Failed to generate quiz')
+            self._update(job_id, status='done', progress=100, quiz_id=quiz.id)
+        except Exception as e:
+            self.app.logger.error(f"Quiz job {job_id} failed: {e}")
+            db.session.rollback()
+            self._update(job_id, status='failed', error=str(e))
+
+    # -- async mode ----------------------------------------------------------
+
+    def _run_loop(self):
+        # The loop's own app context gives coroutines current_app (config and
+        # logging); database work always goes through _run_db
+        with self.app.app_context():
+            asyncio.run(self._async_main())
+
+    async def _async_main(self):
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        last_sweep = time.monotonic()
+        while True:
+            self._wakeup.clear()
+            try:
+                free = self.max_inflight - len(self._inflight)
+                if free > 0:
+                    for job_id, topic, difficulty in await self._run_db(self._claim_queued, free):
+                        task = asyncio.create_task(self._arun_job(job_id, topic, difficulty))
+                        self._inflight.add(task)
+                        task.add_done_callback(self._job_finished)
+            except Exception as e:
+                self.app.logger.error(f"Quiz job loop error: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.sweep_interval)
+            except asyncio.TimeoutError:
+                pass
+            if time.monotonic() - last_sweep >= self.sweep_interval:
+                last_sweep = time.monotonic()
+                try:
+                    await self._run_db(self._requeue_stale)
+                except Exception as e:
+                    self.app.logger.error(f"Quiz job sweep error: {e}")
+
+    def _job_finished(self, task):
+        self._inflight.discard(task)
+        self._wakeup.set()
+
+    async def _run_db(self, fn, *args, **kwargs):
+        """Run blocking database work on a worker thread with its own app context and session"""
+        return await self._loop.run_in_executor(self._db_executor, self._call_in_context,
+                                                functools.partial(fn, *args, **kwargs))
+
+    def _call_in_context(self, fn):
+        with self.app.app_context():
+            try:
+                return fn()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def _claim_queued(self, limit):
+        """Claim up to ``limit`` queued jobs, oldest first"""
+        queued = QuizJob.query.with_entities(QuizJob.id, QuizJob.topic, QuizJob.difficulty)\
+                              .filter_by(status='queued').order_by(QuizJob.created_at).limit(limit).all()
+        return [tuple(row) for row in queued if self._claim(row[0])]
+
+    async def _arun_job(self, job_id, topic, difficulty):
+        from ai_service import AIQuizGenerator
+
+        def on_progress(quiz_id, number, total):
+            self._update(job_id, quiz_id=quiz_id, progress=10 + 90 * number // total)
+
+        try:
+            quiz_id = await AIQuizGenerator().agenerate_quiz(topic, difficulty, self._run_db,
+                                                             stream=self.stream, on_progress=on_progress)
+            if not quiz_id:
+                raise RuntimeError('Failed to generate quiz')
+            await self._run_db(self._update, job_id, status='done', progress=100, quiz_id=quiz_id)
+        except Exception as e:
+            self.app.logger.error(f"Quiz job {job_id} failed: {e}")
+            try:
+                await self._run_db(self._update, job_id, status='failed', error=str(e))
+            except Exception as e:
+                self.app.logger.error(f"Quiz job {job_id} could not be marked failed: {e}")
+
+
+job_queue = JobQueue()
@@ -0,0 +1,394 @@
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from flask import (Response, abort, current_app, g, has_request_context, request, before_render_template,
+                   template_rendered)
+from storage import storage
+
+PREFIX = 'quiz_app_'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('HTTP request latency by endpoint', DEFAULT_BUCKETS),
+    'http_request_sql_queries': ('SQL statements per HTTP request', COUNT_BUCKETS),
+    'http_request_sql_seconds': ('Time spent in SQL per HTTP request', DEFAULT_BUCKETS),
+    'template_render_seconds': ('Template render time', DEFAULT_BUCKETS),
+    'gemini_request_duration_seconds': ('Gemini generate call latency', DEFAULT_BUCKETS),
+}
+COUNTERS = {
+    'gemini_failures_total': 'Gemini calls that raised an error',
+    'gemini_retries_total': 'Gemini calls retried after a failed attempt',
+    'gemini_hedges_total': 'Hedged second Gemini requests sent after GEMINI_HEDGE_AFTER',
+    'gemini_circuit_opened_total': 'Times the Gemini circuit breaker opened',
+    'gemini_circuit_rejected_total': 'Gemini calls skipped because the circuit was open',
+    'quiz_fallbacks_total': 'Quizzes served from the sample fallback generator',
+    'parse_failures_total': 'Gemini responses rejected by parse_ai_response',
+    'question_bank_questions_total': 'Quiz questions taken from the question bank instead of Gemini',
+    'questions_imported_total': 'Questions added by bulk question imports',
+    'cache_hits_total': 'Cache hits by cache',
+    'cache_misses_total': 'Cache misses by cache',
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metrics:
+    """Cheap in-process metrics with Prometheus text output.
+
+    Every thread writes to its own shard without locking; shards are only
+    merged when /metrics is scraped. With METRICS_DIR set, each process
+    also flushes its merged snapshot to a file there so that any gunicorn
+    worker can serve totals for all workers.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.flush_interval = 5
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {'counters': {}, 'histograms': {}}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._collectors = []
+        self._gauges = []
+
+    # -- recording ---------------------------------------------------------
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {'counters': {}, 'histograms': {}}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        counters = self._shard()['counters']
+        key = _key(name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        buckets = HISTOGRAMS[name][1]
+        histograms = self._shard()['histograms']
+        key = _key(name, labels)
+        hist = histograms.get(key)
+        if hist is None:
+            # One slot per bucket, one for +Inf, then the running sum
+            hist = histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        hist[bisect_left(buckets, value)] += 1
+        hist[-1] += value
+
+    def register_collector(self, collector):
+        """Add a callable returning [(counter_name, labels, value)] summed across processes"""
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def register_gauge(self, collector):
+        """Add a callable returning [(gauge_name, labels, value)] read live at scrape time"""
+        if collector not in self._gauges:
+            self._gauges.append(collector)
+
+    # -- merging -----------------------------------------------------------
+
+    @staticmethod
+    def _merge(target, source):
+        for key, value in source['counters'].items():
+            target['counters'][key] = target['counters'].get(key, 0) + value
+        for key, hist in source['histograms'].items():
+            existing = target['histograms'].get(key)
+            if existing is None:
+                target['histograms'][key] = list(hist)
+            else:
+                for i, value in enumerate(hist):
+                    existing[i] += value
+
+    @staticmethod
+    def _copy(shard):
+        # Owner threads may add keys while we read; retry on the rare resize
+        while True:
+            try:
+                return {'counters': dict(shard['counters']),
+                        'histograms': {key: list(hist) for key, hist in shard['histograms'].items()}}
+            except RuntimeError:
+                continue
+
+    def snapshot(self):
+        """Merge all thread shards and collectors of this process"""
+        merged = {'counters': {}, 'histograms': {}}
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    # Fold finished threads' shards in so short-lived pools don't pile up
+                    self._merge(self._retired, self._copy(shard))
+            self._shards = alive
+            self._merge(merged, self._retired)
+            shards = [shard for _, shard in alive]
+
+        for shard in shards:
+            self._merge(merged, self._copy(shard))
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                self._merge(merged, {'counters': {_key(name, labels): value}, 'histograms': {}})
+        return merged
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'metrics-{pid}.json')
+
+    def flush(self):
+        """Write this process's snapshot for the other workers to merge"""
+        snapshot = self.snapshot()
+        data = {
+            'counters': [[name, labels, value] for (name, labels), value in snapshot['counters'].items()],
+            'histograms': [[name, labels, hist] for (name, labels), hist in snapshot['histograms'].items()],
+        }
+        tmp_path = self._path(os.getpid()) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path(os.getpid()))
+
+    def _load(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        return {
+            'counters': {(name, tuple(map(tuple, labels))): value for name, labels, value in data['counters']},
+            'histograms': {(name, tuple(map(tuple, labels))): hist for name, labels, hist in data['histograms']},
+        }
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # Exists, but belongs to another user
+            return True
+        return True
+
+    def _prune_dead(self):
+        """Delete snapshots of processes that have exited (restarts, recycled workers)"""
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                pid = int(os.path.basename(path)[len('metrics-'):-len('.json')])
+            except ValueError:
+                continue
+            if not self._alive(pid):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def collect(self):
+        """This process's live snapshot plus the flushed snapshots of other live processes"""
+        merged = self.snapshot()
+        if self.directory:
+            self._prune_dead()
+            own = self._path(os.getpid())
+            for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+                if path == own:
+                    continue
+                try:
+                    self._merge(merged, self._load(path))
+                except (OSError, ValueError):
+                    continue
+        return merged
+
+    # -- output ------------------------------------------------------------
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+    def render(self):
+        """Prometheus text exposition of all metrics"""
+        merged = self.collect()
+        lines = []
+
+        by_name = {}
+        for (name, labels), value in merged['counters'].items():
+            by_name.setdefault(name, []).append((labels, value))
+        for name in sorted(by_name):
+            lines.append(f'# HELP {PREFIX}{name} {COUNTERS.get(name, name)}')
+            lines.append(f'# TYPE {PREFIX}{name} counter')
+            for labels, value in sorted(by_name[name]):
+                lines.append(f'{PREFIX}{name}{self._labels(labels)} {value}')
+
+        # Hit ratios are derived after merging so they are correct across workers
+        hits = {dict(labels).get('cache'): value for (name, labels), value in merged['counters'].items()
+                if name == 'cache_hits_total'}
+        misses = {dict(labels).get('cache'): value for (name, labels), value in merged['counters'].items()
+                  if name == 'cache_misses_total'}
+        gauges = [('cache_hit_ratio', (('cache', cache),), hits[cache] / (hits[cache] + misses.get(cache, 0)))
+                  for cache in sorted(hits) if hits[cache] + misses.get(cache, 0)]
+        for collector in self._gauges:
+            gauges.extend((name, tuple(sorted(labels.items())), value) for name, labels, value in collector())
+        for name in sorted({name for name, _, _ in gauges}):
+            lines.append(f'# TYPE {PREFIX}{name} gauge')
+            for gauge_name, labels, value in gauges:
+                if gauge_name == name:
+                    lines.append(f'{PREFIX}{name}{self._labels(labels)} {round(value, 4)}')
+
+        by_name = {}
+        for (name, labels), hist in merged['histograms'].items():
+            by_name.setdefault(name, []).append((labels, hist))
+        for name in sorted(by_name):
+            help_text, buckets = HISTOGRAMS[name]
+            lines.append(f'# HELP {PREFIX}{name} {help_text}')
+            lines.append(f'# TYPE {PREFIX}{name} histogram')
+            for labels, hist in sorted(by_name[name]):
+                cumulative = 0
+                for bound, count in zip(buckets, hist):
+                    cumulative += count
+                    lines.append(f'{PREFIX}{name}_bucket{self._labels(labels, [("le", bound)])} {cumulative}')
+                cumulative += hist[len(buckets)]
+                lines.append(f'{PREFIX}{name}_bucket{self._labels(labels, [("le", "+Inf")])} {cumulative}')
+                lines.append(f'{PREFIX}{name}_sum{self._labels(labels)} {round(hist[-1], 6)}')
+                lines.append(f'{PREFIX}{name}_count{self._labels(labels)} {cumulative}')
+
+        return '\n'.join(lines) + '\n'
+
+    # -- Flask integration -------------------------------------------------
+
+    def start(self):
+        """Start the per-process flusher when metrics are shared through METRICS_DIR"""
+        if not (self.enabled and self.directory):
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def init_app(self, app, db):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        if not self.enabled:
+            return
+        self.directory = app.config.get('METRICS_DIR') or None
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 5)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._prune_dead()
+        token = app.config.get('METRICS_TOKEN')
+        if not token:
+            app.logger.info('METRICS_TOKEN is not set, /metrics is only served in debug mode')
+
+        def before_sql(conn, cursor, statement, parameters, context, executemany):
+            if has_request_context() and 'metrics_start' in g:
+                g.metrics_sql_start = time.perf_counter()
+
+        def after_sql(conn, cursor, statement, parameters, context, executemany):
+            if has_request_context() and 'metrics_sql_start' in g:
+                g.metrics_sql_queries += 1
+                g.metrics_sql_seconds += time.perf_counter() - g.pop('metrics_sql_start')
+
+        with app.app_context():
+            storage.listen(db.engine, 'before_cursor_execute', before_sql)
+            storage.listen(db.engine, 'after_cursor_execute', after_sql)
+
+        @app.before_request
+        def start_request_timer():
+            g.metrics_start = time.perf_counter()
+            g.metrics_sql_queries = 0
+            g.metrics_sql_seconds = 0.0
+
+        def record(state, endpoint, method, status):
+            start = state.pop('metrics_start', None)
+            if start is not None:
+                self.observe('http_request_duration_seconds', time.perf_counter() - start,
+                             endpoint=endpoint, method=method, status=status)
+                self.observe('http_request_sql_queries', state.metrics_sql_queries, endpoint=endpoint)
+                self.observe('http_request_sql_seconds', state.metrics_sql_seconds, endpoint=endpoint)
+
+        @app.after_request
+        def record_request(response):
+            if 'metrics_start' not in g:
+                return response
+            args = (g._get_current_object(), request.endpoint or 'unmatched', request.method, response.status_code)
+            if g.get('streamed_page'):
+                # Streamed pages render, and query, until the response is closed
+                response.call_on_close(lambda: record(*args))
+            else:
+                record(*args)
+            return response
+
+        def template_started(sender, template, context, **extra):
+            g.setdefault('metrics_templates', []).append(time.perf_counter())
+
+        def template_finished(sender, template, context, **extra):
+            starts = g.get('metrics_templates')
+            if starts:
+                self.observe('template_render_seconds', time.perf_counter() - starts.pop(),
+                             template=template.name or 'string')
+
+        before_render_template.connect(template_started, app, weak=False)
+        template_rendered.connect(template_finished, app, weak=False)
+
+        self.register_collector(_cache_samples)
+        self.register_gauge(_queue_gauges)
+
+        def metrics_view():
+            if not token:
+                # Never public by accident in production
+                if not (current_app.debug or current_app.testing):
+                    abort(404)
+            elif request.headers.get('Authorization') != f'Bearer {token}':
+                abort(401)
+            return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+        app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+def _cache_samples():
+    from answer_key import answer_keys
+    from quiz_cache import quiz_cache
+    from quiz_pool import quiz_pool
+    from user_cache import user_cache
+
+    samples = []
+    for cache, stats in (('quiz', quiz_cache.stats()), ('answer_key', answer_keys.stats()),
+                         ('pool', quiz_pool.stats()), ('user', user_cache.stats())):
+        samples.append(('cache_hits_total', {'cache': cache}, stats['hits']))
+        samples.append(('cache_misses_total', {'cache': cache}, stats['misses']))
+    return samples
+
+
+def _queue_gauges():
+    from job_queue import job_queue
+
+    stats = job_queue.stats()
+    return [
+        ('job_queue_depth', {}, stats['queued']),
+        ('job_queue_running', {}, stats['running']),
+    ]
+
+
+metrics = Metrics()
@@ -1,9 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
+from flask import current_app
 from flask_login import UserMixin
 from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
 from werkzeug.security import generate_password_hash, check_password_hash
+from storage import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -23,6 +26,10 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
+    @property
+    def is_admin(self):
+        return self.username in current_app.config.get('ADMIN_USERS', [])
+    
     def __repr__(self):
         return f'<User {self.username}>'
 
@@ -36,7 +43,7 @@ class Quiz(db.Model):
     
     # Relationships
     questions = db.relationship('Question', backref='quiz', lazy=True, cascade='all, delete-orphan')
-    results = db.relationship('QuizResult', backref='quiz', lazy=True)
+    results = db.relationship('QuizResult', back_populates='quiz', lazy=True)
     
     def __repr__(self):
         return f'<Quiz {self.topic} - {self.difficulty}>'
@@ -77,14 +84,24 @@ class Question(db.Model):
 
 class QuizResult(db.Model):
     __tablename__ = 'quiz_results'
+    __table_args__ = (
+        # Covers keyset-paginated history: filter on user, order by (taken_at, id)
+        db.Index('ix_quiz_results_user_taken', 'user_id', 'taken_at', 'id', 'quiz_id', 'score'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False)
     score = db.Column(db.Integer, nullable=False)
-    user_answers = db.Column(db.JSON, nullable=False)  # Store user's answers as JSON
+    # One option letter per question in question order ('-' = unanswered),
+    # see AnswerKey.encode; rows from before `flask compact-answers` hold JSON
+    user_answers = db.Column(db.String(100), nullable=False)
     taken_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Lazy by default; list views load it with db.joinedload(QuizResult.quiz)
+    # because to_dict() reads the quiz topic and difficulty
+    quiz = db.relationship('Quiz', back_populates='results')
+    
     def __repr__(self):
         return f'<QuizResult User:{self.user_id} Quiz:{self.quiz_id} Score:{self.score}/10>'
     
@@ -97,3 +114,268 @@ class QuizResult(db.Model):
             'quiz_topic': self.quiz.topic,
             'quiz_difficulty': self.quiz.difficulty
         }
+
+class QuizJob(db.Model):
+    __tablename__ = 'quiz_jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    topic = db.Column(db.String(200), nullable=False)
+    difficulty = db.Column(db.Enum('simple', 'medium', 'hard'), nullable=False)
+    status = db.Column(db.Enum('queued', 'running', 'done', 'failed'), nullable=False, default='queued', index=True)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), index=True)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<QuizJob {self.id} {self.status}>'
+    
+    @classmethod
+    def is_generating(cls, quiz_id):
+        """True while a streaming job is still adding questions to this quiz"""
+        return db.session.query(
+            cls.query.filter(cls.quiz_id == quiz_id, cls.status.in_(['queued', 'running'])).exists()
+        ).scalar()
+    
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': self.progress,
+            'quiz_id': self.quiz_id,
+            'error': self.error,
+            'topic': self.topic,
+            'difficulty': self.difficulty
+        }
+
+class QuizPoolEntry(db.Model):
+    __tablename__ = 'quiz_pool'
+    
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), primary_key=True)
+    topic_key = db.Column(db.String(200), nullable=False)
+    difficulty = db.Column(db.Enum('simple', 'medium', 'hard'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    claimed_at = db.Column(db.DateTime, index=True)
+    
+    def __repr__(self):
+        return f'<QuizPoolEntry {self.quiz_id} {self.topic_key} - {self.difficulty}>'
+
+class UserStats(db.Model):
+    """Per-user rollup of quiz results, updated on every submit"""
+    __tablename__ = 'user_stats'
+    __table_args__ = (
+        # Global leaderboard: ORDER BY total_score DESC LIMIT n walks this backwards
+        db.Index('ix_user_stats_total_score', 'total_score'),
+    )
+    
+    DIFFICULTIES = ('simple', 'medium', 'hard')
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    total_quizzes = db.Column(db.Integer, nullable=False, default=0)
+    total_score = db.Column(db.Integer, nullable=False, default=0)
+    best_score = db.Column(db.Integer, nullable=False, default=0)
+    simple_count = db.Column(db.Integer, nullable=False, default=0)
+    simple_score = db.Column(db.Integer, nullable=False, default=0)
+    medium_count = db.Column(db.Integer, nullable=False, default=0)
+    medium_score = db.Column(db.Integer, nullable=False, default=0)
+    hard_count = db.Column(db.Integer, nullable=False, default=0)
+    hard_score = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UserStats User:{self.user_id} Quizzes:{self.total_quizzes}>'
+    
+    @classmethod
+    def get_or_build(cls, user_id):
+        """Return the user's stats row, rebuilding it from history if it does not exist yet"""
+        stats = db.session.get(cls, user_id)
+        if stats is None:
+            cls._seed(user_id)
+            db.session.commit()
+            stats = db.session.get(cls, user_id)
+        return stats
+    
+    @classmethod
+    def record(cls, user_id, score, difficulty):
+        """Add one result to the rollup; the caller commits together with the QuizResult.
+        
+        Call this before adding the new QuizResult to the session, otherwise a
+        first-time rebuild would already count it.
+        """
+        cls.record_many(user_id, {difficulty: [score]})
+    
+    @classmethod
+    def record_many(cls, user_id, scores_by_difficulty):
+        """Add a batch of a user's results, given as {difficulty: [score, ...]}"""
+        # Column expressions keep concurrent submits from overwriting each other
+        increments = cls._increments(scores_by_difficulty)
+        updated = db.session.query(cls).filter_by(user_id=user_id).update(increments, synchronize_session=False)
+        if not updated:
+            cls._seed(user_id)
+            db.session.query(cls).filter_by(user_id=user_id).update(increments, synchronize_session=False)
+    
+    @classmethod
+    def _seed(cls, user_id):
+        """Create the user's row from their history unless another request already has.
+        
+        Two first submits can both find no row; the second insert then does
+        nothing and its increments land on the row the first one created.
+        """
+        insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+        db.session.execute(insert(cls).values(user_id=user_id, **cls._history(user_id))
+                                       .on_conflict_do_nothing(index_elements=[cls.user_id]))
+    
+    @classmethod
+    def _increments(cls, scores_by_difficulty):
+        all_scores = [score for scores in scores_by_difficulty.values() for score in scores]
+        best = max(all_scores)
+        increments = {
+            cls.total_quizzes: cls.total_quizzes + len(all_scores),
+            cls.total_score: cls.total_score + sum(all_scores),
+            cls.best_score: db.case((cls.best_score < best, best), else_=cls.best_score),
+            cls.updated_at: datetime.utcnow()
+        }
+        for difficulty, scores in scores_by_difficulty.items():
+            count_column = getattr(cls, f'{difficulty}_count')
+            score_column = getattr(cls, f'{difficulty}_score')
+            increments[count_column] = count_column + len(scores)
+            increments[score_column] = score_column + sum(scores)
+        return increments
+    
+    @classmethod
+    def _history(cls, user_id):
+        """The rollup's column values computed from the user's full quiz history"""
+        rows = db.session.query(
+            Quiz.difficulty,
+            db.func.count(QuizResult.id),
+            db.func.coalesce(db.func.sum(QuizResult.score), 0),
+            db.func.coalesce(db.func.max(QuizResult.score), 0)
+        ).join(Quiz, Quiz.id == QuizResult.quiz_id)\
+         .filter(QuizResult.user_id == user_id)\
+         .group_by(Quiz.difficulty).all()
+        
+        values = {'total_quizzes': 0, 'total_score': 0, 'best_score': 0}
+        for difficulty in cls.DIFFICULTIES:
+            values[f'{difficulty}_count'] = values[f'{difficulty}_score'] = 0
+        for difficulty, count, total, best in rows:
+            values[f'{difficulty}_count'] = count
+            values[f'{difficulty}_score'] = total
+            values['total_quizzes'] += count
+            values['total_score'] += total
+            values['best_score'] = max(values['best_score'], best)
+        return values
+    
+    @classmethod
+    def rebuild(cls, user_id):
+        """Recompute a user's rollup from their full quiz history"""
+        values = cls._history(user_id)
+        stats = db.session.get(cls, user_id)
+        if stats is None:
+            stats = cls(user_id=user_id)
+            db.session.add(stats)
+        for column, value in values.items():
+            setattr(stats, column, value)
+        
+        db.session.flush()
+        return stats
+    
+    def to_dict(self):
+        difficulty_stats = {}
+        for difficulty in self.DIFFICULTIES:
+            count = getattr(self, f'{difficulty}_count')
+            total = getattr(self, f'{difficulty}_score')
+            difficulty_stats[difficulty] = {
+                'count': count,
+                'average_score': round(total / count, 1) if count else 0
+            }
+        
+        return {
+            'total_quizzes': self.total_quizzes,
+            'average_score': round(self.total_score / self.total_quizzes, 1) if self.total_quizzes else 0,
+            'best_score': self.best_score,
+            'total_score': self.total_score,
+            'difficulty_stats': difficulty_stats
+        }
+
+class QuestionStats(db.Model):
+    """Per-question answer counts, rolled up from quiz results by analytics.py"""
+    __tablename__ = 'question_stats'
+    
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False, index=True)
+    correct_option = db.Column(db.Enum('A', 'B', 'C', 'D'), nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+    option_a = db.Column(db.Integer, nullable=False, default=0)
+    option_b = db.Column(db.Integer, nullable=False, default=0)
+    option_c = db.Column(db.Integer, nullable=False, default=0)
+    option_d = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<QuestionStats Question:{self.question_id} {self.correct}/{self.attempts}>'
+    
+    def to_dict(self):
+        chosen = {'A': self.option_a, 'B': self.option_b, 'C': self.option_c, 'D': self.option_d}
+        wrong = {option: count for option, count in chosen.items() if option != self.correct_option and count}
+        return {
+            'question_id': self.question_id,
+            'attempts': self.attempts,
+            'percent_correct': round(100 * self.correct / self.attempts, 1) if self.attempts else None,
+            'chosen': chosen,
+            'most_chosen_wrong': max(wrong, key=wrong.get) if wrong else None
+        }
+
+class LeaderboardEntry(db.Model):
+    """A user's best score on one quiz or one topic, rolled up by analytics.py"""
+    __tablename__ = 'leaderboard_entries'
+    
+    scope = db.Column(db.Enum('quiz', 'topic'), primary_key=True)
+    scope_key = db.Column(db.String(200), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    best_score = db.Column(db.Integer, nullable=False, default=0)
+    achieved_at = db.Column(db.DateTime, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    total_score = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<LeaderboardEntry {self.scope}:{self.scope_key} User:{self.user_id} {self.best_score}>'
+
+# Top-n of one board is a prefix scan: best score first, earliest to reach it breaks ties
+db.Index('ix_leaderboard_rank', LeaderboardEntry.scope, LeaderboardEntry.scope_key,
+         LeaderboardEntry.best_score.desc(), LeaderboardEntry.achieved_at)
+
+class AnalyticsCursor(db.Model):
+    """Id of the last quiz result folded into the analytics rollups"""
+    __tablename__ = 'analytics_cursor'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    last_result_id = db.Column(db.Integer, nullable=False, default=0)
+
+class QuestionImport(db.Model):
+    """Progress of a named bulk question import, committed with every batch so it can resume"""
+    __tablename__ = 'question_imports'
+    
+    name = db.Column(db.String(255), primary_key=True)
+    # Source quizzes consumed so far, imported or rejected
+    quizzes_read = db.Column(db.Integer, nullable=False, default=0)
+    quizzes_imported = db.Column(db.Integer, nullable=False, default=0)
+    questions_imported = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<QuestionImport {self.name}: {self.quizzes_read} read>'
+
+def create_missing_indexes():
+    """Create indexes declared on tables that already existed.
+    
+    ``db.create_all()`` skips existing tables entirely, including any index
+    added to their models later.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
@@ -0,0 +1,72 @@
+from flask import g, has_request_context, request
+from models import db
+from storage import storage
+
+BUDGET_MODES = ('off', 'log', 'raise')
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in 'raise' mode when a view runs more SQL statements than it declared"""
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of SQL statements a view may run per request.
+
+    The budget is stored as a function attribute, which ``functools.wraps``
+    copies through decorators such as ``login_required``.
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def init_query_budget(app):
+    """Count SQL statements per request and enforce the views' declared budgets.
+
+    SQL_QUERY_BUDGET_MODE is 'off' (default), 'log' (warn in the app log)
+    or 'raise' (fail the request, meant for tests). When counting is on the
+    count is also returned in an ``X-SQL-Queries`` header.
+    """
+    mode = app.config.get('SQL_QUERY_BUDGET_MODE', 'off')
+    if mode not in BUDGET_MODES:
+        app.logger.warning(f"Unknown SQL_QUERY_BUDGET_MODE '{mode}', query budgets disabled")
+        mode = 'off'
+    if mode == 'off':
+        return
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'sql_queries' in g:
+            g.sql_queries += 1
+
+    with app.app_context():
+        storage.listen(db.engine, 'before_cursor_execute', count_statement)
+
+    @app.before_request
+    def start_query_count():
+        g.sql_queries = 0
+
+    def check(endpoint, count):
+        budget = getattr(app.view_functions.get(endpoint), 'query_budget', None)
+        if budget is not None and count > budget:
+            message = f'{endpoint} ran {count} SQL statements, budget is {budget}'
+            if mode == 'raise':
+                raise QueryBudgetExceeded(message)
+            app.logger.warning(f'Query budget exceeded: {message}')
+
+    @app.after_request
+    def check_query_budget(response):
+        endpoint = request.endpoint
+        if g.get('streamed_page'):
+            # The template is still to render; its statements are counted
+            # while it streams and checked once the response is closed. The
+            # header only covers the statements run so far.
+            response.headers['X-SQL-Queries'] = str(g.get('sql_queries', 0))
+            state = g._get_current_object()
+            response.call_on_close(lambda: check(endpoint, state.pop('sql_queries', 0)))
+            return response
+
+        count = g.pop('sql_queries', 0)
+        response.headers['X-SQL-Queries'] = str(count)
+        check(endpoint, count)
+        return response
@@ -0,0 +1,162 @@
+import random
+from sqlalchemy import bindparam, text
+from models import Quiz, Question, db
+from metrics import metrics
+from topic_index import canonical_topic
+
+BANK_FIELDS = ('question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'explanation')
+
+# Fallback quizzes are placeholders, never bank material
+FALLBACK_PATTERN = 'Question %: This is a sample %'
+
+
+class QuestionBank:
+    """SQLite FTS5 index of generated questions for assembling quizzes without Gemini.
+
+    Every question Gemini writes is added to the ``question_bank`` table
+    along with its quiz's topic and difficulty. A new quiz is built from the
+    best full-text matches for the topic at that difficulty, skipping
+    duplicate question texts and taking at most QUESTION_BANK_MAX_PER_QUIZ
+    questions from any one source quiz; Gemini is only asked for the
+    shortfall. The bank is self-contained, so it keeps serving questions
+    after their source quiz is gone.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.min_matches = 5
+        self.max_per_quiz = 3
+        self.count = 10
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = (app.config.get('QUESTION_BANK_ENABLED', True)
+                        and app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'))
+        self.min_matches = app.config.get('QUESTION_BANK_MIN_MATCHES', 5)
+        self.max_per_quiz = app.config.get('QUESTION_BANK_MAX_PER_QUIZ', 3)
+        self.count = app.config.get('QUIZ_QUESTIONS_COUNT', 10)
+
+    def create_schema(self):
+        """Create the FTS5 table, filling it from existing questions the first time"""
+        if not self.enabled:
+            return
+        exists = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'question_bank'")).first()
+        if exists:
+            return
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE question_bank USING fts5("
+            "topic, question_text, option_a, option_b, option_c, option_d, explanation, "
+            "correct_option UNINDEXED, difficulty UNINDEXED, quiz_id UNINDEXED, "
+            "tokenize = 'porter unicode61 remove_diacritics 2')"))
+        self.rebuild()
+
+    def rebuild(self):
+        """Re-index every stored question; returns the number indexed"""
+        db.session.execute(text('DELETE FROM question_bank'))
+        db.session.execute(text(
+            "INSERT INTO question_bank (rowid, topic, question_text, option_a, option_b, option_c, option_d, "
+            "explanation, correct_option, difficulty, quiz_id) "
+            "SELECT questions.id, quizzes.topic, question_text, option_a, option_b, option_c, option_d, "
+            "explanation, correct_option, quizzes.difficulty, quizzes.id "
+            "FROM questions JOIN quizzes ON quizzes.id = questions.quiz_id "
+            "WHERE question_text NOT LIKE :fallback "
+            # Quizzes built from the bank or the cache hold copies; index each text once
+            "AND questions.id IN (SELECT min(id) FROM questions GROUP BY question_text)"),
+            {'fallback': FALLBACK_PATTERN})
+        db.session.commit()
+        return db.session.execute(text('SELECT count(*) FROM question_bank')).scalar()
+
+    def add(self, questions, topic, difficulty):
+        """Index freshly generated (flushed) questions; committed with the caller's transaction"""
+        if not self.enabled or not questions:
+            return
+        db.session.execute(text(
+            "INSERT INTO question_bank (rowid, topic, question_text, option_a, option_b, option_c, option_d, "
+            "explanation, correct_option, difficulty, quiz_id) "
+            "VALUES (:id, :topic, :question_text, :option_a, :option_b, :option_c, :option_d, "
+            ":explanation, :correct_option, :difficulty, :quiz_id)"),
+            [{'id': question.id, 'topic': topic, 'difficulty': difficulty, 'quiz_id': question.quiz_id,
+              'correct_option': question.correct_option,
+              **{field: getattr(question, field) for field in BANK_FIELDS}} for question in questions])
+
+    def add_quizzes(self, quiz_ids):
+        """Index every question of bulk-inserted quizzes; committed with the caller's transaction"""
+        if not self.enabled or not quiz_ids:
+            return
+        db.session.execute(text(
+            "INSERT INTO question_bank (rowid, topic, question_text, option_a, option_b, option_c, option_d, "
+            "explanation, correct_option, difficulty, quiz_id) "
+            "SELECT questions.id, quizzes.topic, question_text, option_a, option_b, option_c, option_d, "
+            "explanation, correct_option, quizzes.difficulty, quizzes.id "
+            "FROM questions JOIN quizzes ON quizzes.id = questions.quiz_id "
+            "WHERE quizzes.id IN :quiz_ids").bindparams(bindparam('quiz_ids', expanding=True)),
+            {'quiz_ids': list(quiz_ids)})
+
+    def remove_quiz(self, quiz_id):
+        """Drop a deleted quiz's questions, whose ids SQLite may reuse; committed with the caller's transaction"""
+        if not self.enabled:
+            return
+        db.session.execute(text('DELETE FROM question_bank WHERE quiz_id = :quiz_id'), {'quiz_id': quiz_id})
+
+    def find(self, topic, difficulty, limit=None):
+        """Up to ``limit`` distinct bank questions for a topic, as question data dicts.
+
+        The best-ranked matches are oversampled and a random subset returned,
+        so repeated requests for one topic do not get the same quiz.
+        """
+        limit = limit or self.count
+        words = canonical_topic(topic).split()
+        if not self.enabled or not words:
+            return []
+        # Quote every word so user input cannot use FTS5 query syntax
+        query = ' '.join('"' + word.replace('"', '""') + '"' for word in words)
+        rows = db.session.execute(text(
+            "SELECT quiz_id, question_text, option_a, option_b, option_c, option_d, explanation, correct_option "
+            "FROM question_bank WHERE question_bank MATCH :query AND difficulty = :difficulty "
+            "ORDER BY bm25(question_bank, 10.0, 2.0, 1.0, 1.0, 1.0, 1.0, 0.5) LIMIT :scan"),
+            {'query': query, 'difficulty': difficulty, 'scan': limit * 10}).mappings()
+
+        picked = []
+        seen = set()
+        per_quiz = {}
+        for row in rows:
+            key = ' '.join(row['question_text'].lower().split())
+            if key in seen or per_quiz.get(row['quiz_id'], 0) >= self.max_per_quiz:
+                continue
+            seen.add(key)
+            per_quiz[row['quiz_id']] = per_quiz.get(row['quiz_id'], 0) + 1
+            picked.append({field: row[field] for field in BANK_FIELDS + ('correct_option',)})
+            if len(picked) >= limit * 3:
+                break
+
+        if len(picked) > limit:
+            picked = random.sample(picked, limit)
+        random.shuffle(picked)
+        return picked
+
+    def assemble(self, topic, difficulty):
+        """A new quiz made entirely of bank questions, or None if the bank cannot fill one"""
+        if not self.enabled:
+            return None
+        questions_data = self.find(topic, difficulty)
+        if len(questions_data) < self.count:
+            return None
+
+        quiz = Quiz(topic=topic, difficulty=difficulty)
+        db.session.add(quiz)
+        db.session.flush()
+        for number, q_data in enumerate(questions_data, 1):
+            db.session.add(Question(quiz_id=quiz.id, question_number=number, **q_data))
+        db.session.commit()
+        metrics.inc('question_bank_questions_total', len(questions_data))
+        return quiz
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """Alembic filter that keeps the FTS5 table and its shadow tables out of migrations"""
+    return not (type_ == 'table' and name.startswith('question_bank'))
+
+
+question_bank = QuestionBank()
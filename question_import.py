@@ -0,0 +1,220 @@
+import codecs
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy import insert
+from ai_service import validate_question_data
+from metrics import metrics
+from models import Question, QuestionImport, Quiz, UserStats, db
+from question_bank import question_bank
+
+IMPORT_FORMATS = ('json', 'csv')
+QUESTION_FIELDS = ('question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_option', 'explanation')
+# QuizResult.user_answers stores one letter per question
+MAX_QUESTIONS = 100
+MAX_ERRORS = 100
+READ_SIZE = 1 << 20
+# A single quiz object larger than this is treated as malformed input
+MAX_OBJECT_SIZE = 16 << 20
+
+
+def iter_json_quizzes(stream):
+    """Quiz objects from a JSON array or NDJSON stream, decoded one at a time.
+
+    ``stream`` may yield bytes or text. Only the current read and any
+    partially received object are kept in memory.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    pos = 0
+    eof = False
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,[]':
+            pos += 1
+        if pos < len(buffer):
+            try:
+                quiz, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if eof or len(buffer) - pos > MAX_OBJECT_SIZE:
+                    raise ValueError(f'Invalid JSON: {e}') from None
+            else:
+                yield quiz
+                pos = end
+                continue
+        elif eof:
+            return
+
+        # Need more input: drop what is already decoded, then read
+        buffer = buffer[pos:]
+        pos = 0
+        chunk = stream.read(READ_SIZE)
+        if isinstance(chunk, bytes):
+            chunk = utf8.decode(chunk, final=not chunk)
+        eof = not chunk
+        buffer += chunk
+
+
+def iter_csv_quizzes(stream):
+    """Quizzes from CSV rows with ``topic``, ``difficulty`` and the question columns.
+
+    Consecutive rows with the same topic and difficulty (and ``quiz_id``,
+    if the file has that column, as ``flask export-quizzes`` writes) form
+    one quiz.
+    """
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    quiz = None
+    key = None
+    for row in csv.DictReader(stream):
+        row_key = (row.get('quiz_id'), row.get('topic'), row.get('difficulty'))
+        if quiz is None or row_key != key:
+            if quiz is not None:
+                yield quiz
+            key = row_key
+            quiz = {'topic': row.get('topic'), 'difficulty': row.get('difficulty'), 'questions': []}
+        quiz['questions'].append({field: row[field] for field in QUESTION_FIELDS if row.get(field) is not None})
+    if quiz is not None:
+        yield quiz
+
+
+def validate_quiz(quiz):
+    """Raise ValueError unless ``quiz`` is a topic, a difficulty and 1-100 valid questions"""
+    if not isinstance(quiz, dict):
+        raise ValueError('Quiz is not an object')
+
+    topic = quiz.get('topic')
+    max_length = Quiz.topic.type.length
+    if not isinstance(topic, str) or not topic.strip() or len(topic.strip()) > max_length:
+        raise ValueError(f'Topic must be 1-{max_length} characters')
+    if quiz.get('difficulty') not in UserStats.DIFFICULTIES:
+        raise ValueError(f"Invalid difficulty '{quiz.get('difficulty')}'")
+
+    questions = quiz.get('questions')
+    if not isinstance(questions, list) or not 1 <= len(questions) <= MAX_QUESTIONS:
+        raise ValueError(f'A quiz needs between 1 and {MAX_QUESTIONS} questions')
+
+    for number, q in enumerate(questions, 1):
+        validate_question_data(q, number)
+        for field in QUESTION_FIELDS:
+            if not isinstance(q[field], str) or not q[field].strip():
+                raise ValueError(f"Empty field '{field}' in question {number}")
+            max_length = getattr(Question, field).type.length
+            if max_length and len(q[field]) > max_length:
+                raise ValueError(f"Field '{field}' longer than {max_length} characters in question {number}")
+
+
+def _insert_batch(quizzes):
+    """Insert validated quizzes and their questions with executemany; returns the question count"""
+    quiz_ids = db.session.execute(
+        insert(Quiz).returning(Quiz.id, sort_by_parameter_order=True),
+        [{'topic': quiz['topic'].strip(), 'difficulty': quiz['difficulty']} for quiz in quizzes]
+    ).scalars().all()
+
+    rows = [dict({field: q[field] for field in QUESTION_FIELDS}, quiz_id=quiz_id, question_number=number)
+            for quiz_id, quiz in zip(quiz_ids, quizzes)
+            for number, q in enumerate(quiz['questions'], 1)]
+    db.session.execute(insert(Question), rows)
+    question_bank.add_quizzes(quiz_ids)
+    return len(rows)
+
+
+def import_quizzes(quizzes, name=None, batch_size=2000, restart=False):
+    """Validate and insert an iterable of quiz dicts in batched transactions.
+
+    Each quiz is ``{'topic', 'difficulty', 'questions': [...]}`` with
+    questions in the shape Gemini returns. Quizzes are inserted with Core
+    executemany in transactions of about ``batch_size`` questions, and a
+    named import records how many source quizzes it has consumed in the
+    same transaction, so running it again after a failure skips straight
+    past everything already committed. Invalid quizzes are skipped and
+    reported.
+
+    Returns a summary dict with the import totals (including earlier runs
+    of the same name), whether the input was read to the end and up to
+    MAX_ERRORS ``{'quiz', 'message'}`` errors from this run.
+    """
+    progress = db.session.get(QuestionImport, name) if name else None
+    if progress is not None and restart:
+        db.session.delete(progress)
+        db.session.flush()
+        progress = None
+    if progress is None:
+        progress = QuestionImport(name=name or f'import-{datetime.utcnow().isoformat()}', quizzes_read=0,
+                                  quizzes_imported=0, questions_imported=0, rejected=0)
+        db.session.add(progress)
+        db.session.commit()
+    resumed_from = progress.quizzes_read
+
+    errors = []
+    pending = []
+    pending_questions = 0
+    read = resumed_from
+    complete = False
+
+    def flush():
+        nonlocal pending, pending_questions
+        imported = _insert_batch(pending) if pending else 0
+        progress.quizzes_read = read
+        progress.quizzes_imported += len(pending)
+        progress.questions_imported += imported
+        progress.updated_at = datetime.utcnow()
+        db.session.commit()
+        metrics.inc('questions_imported_total', imported)
+        pending = []
+        pending_questions = 0
+
+    try:
+        source = iter(quizzes) if progress.finished_at is None else iter(())
+        number = 0
+        while True:
+            try:
+                quiz = next(source)
+            except StopIteration:
+                complete = True
+                break
+            except (ValueError, csv.Error, UnicodeDecodeError) as e:
+                # Malformed input: keep what was read and report where parsing stopped
+                errors.append({'quiz': number + 1, 'message': str(e)})
+                break
+            number += 1
+            if number <= resumed_from:
+                continue
+
+            read = number
+            try:
+                validate_quiz(quiz)
+            except ValueError as e:
+                progress.rejected += 1
+                if len(errors) < MAX_ERRORS:
+                    errors.append({'quiz': number, 'message': str(e)})
+                continue
+
+            pending.append(quiz)
+            pending_questions += len(quiz['questions'])
+            if pending_questions >= batch_size:
+                flush()
+
+        if complete and progress.finished_at is None:
+            progress.finished_at = datetime.utcnow()
+        flush()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        'name': progress.name,
+        'complete': complete,
+        'resumed_from': resumed_from,
+        'quizzes_read': progress.quizzes_read,
+        'quizzes_imported': progress.quizzes_imported,
+        'questions_imported': progress.questions_imported,
+        'rejected': progress.rejected,
+        'errors': errors
+    }
+
+
+def read_quizzes(stream, fmt):
+    """Stream-parse quizzes from a binary or text stream in ``fmt`` ('json' also accepts NDJSON)"""
+    return iter_csv_quizzes(stream) if fmt == 'csv' else iter_json_quizzes(stream)
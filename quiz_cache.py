@@ -0,0 +1,165 @@
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from models import Quiz, Question, db
+
+CACHE_POLICIES = ('off', 'reuse', 'mix')
+
+
+def normalize_topic(topic):
+    """Lowercase a topic and strip punctuation/extra whitespace for cache keys"""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', topic.lower()).split())
+
+
+class QuizCache:
+    """LRU cache of generated quiz ids keyed on normalized (topic, difficulty).
+
+    Only quiz ids are held in memory; a hit either hands back an existing
+    quiz ('reuse') or assembles a new quiz from the stored questions of the
+    cached quizzes for that key ('mix').
+    """
+
+    def __init__(self, app=None):
+        self.policy = 'off'
+        self.ttl = 0
+        self.max_reuse = 0
+        self.max_entries = 0
+        self.max_quizzes_per_key = 5
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        policy = app.config.get('QUIZ_CACHE_POLICY', 'reuse')
+        if policy not in CACHE_POLICIES:
+            app.logger.warning(f"Unknown QUIZ_CACHE_POLICY '{policy}', disabling quiz cache")
+            policy = 'off'
+        self.policy = policy
+        self.ttl = app.config.get('QUIZ_CACHE_TTL', 3600)
+        self.max_reuse = app.config.get('QUIZ_CACHE_MAX_REUSE', 20)
+        self.max_entries = app.config.get('QUIZ_CACHE_MAX_ENTRIES', 500)
+        self.clear()
+
+    @property
+    def enabled(self):
+        return self.policy != 'off' and self.max_entries > 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'policy': self.policy,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+    def _take(self, key):
+        """Claim one use of a live entry and return its quiz ids, or None on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and now - entry['created_at'] > self.ttl:
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            # An entry that has been served max_reuse times stays around (its
+            # questions are still useful for 'mix') but forces a fresh generation.
+            if entry is None or (self.max_reuse and entry['uses'] >= self.max_reuse):
+                self.misses += 1
+                return None
+            entry['uses'] += 1
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry['quiz_ids'])
+
+    def get(self, topic, difficulty):
+        """Return a quiz for a cache hit, or None if the caller has to generate one"""
+        if not self.enabled:
+            return None
+        key = (normalize_topic(topic), difficulty)
+        quiz_ids = self._take(key)
+        if not quiz_ids:
+            return None
+
+        if self.policy == 'mix':
+            quiz = self._mix_quiz(topic, difficulty, quiz_ids)
+            if quiz:
+                return quiz
+
+        quiz = db.session.get(Quiz, quiz_ids[-1])
+        if quiz is None:
+            self.discard(topic, difficulty)
+        return quiz
+
+    def put(self, topic, difficulty, quiz):
+        """Record a freshly generated quiz for its (topic, difficulty) key"""
+        if not self.enabled:
+            return
+        key = (normalize_topic(topic), difficulty)
+        # Read the id outside the lock: after a commit it may cost a query,
+        # and waiting on a connection while holding the lock can deadlock
+        quiz_id = quiz.id
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {'quiz_ids': [], 'uses': 0, 'created_at': 0}
+            entry['quiz_ids'] = (entry['quiz_ids'] + [quiz_id])[-self.max_quizzes_per_key:]
+            entry['uses'] = 0
+            entry['created_at'] = time.monotonic()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, topic, difficulty):
+        with self._lock:
+            self._entries.pop((normalize_topic(topic), difficulty), None)
+
+    def _mix_quiz(self, topic, difficulty, quiz_ids):
+        """Build a new quiz from a random sample of the cached quizzes' questions"""
+        from flask import current_app
+        count = current_app.config.get('QUIZ_QUESTIONS_COUNT', 10)
+        pool = Question.query.filter(Question.quiz_id.in_(quiz_ids)).all()
+
+        # Skip duplicate question texts picked up from overlapping generations
+        unique = {}
+        for question in pool:
+            unique.setdefault(question.question_text.strip().lower(), question)
+        if len(unique) < count:
+            return None
+
+        picked = random.sample(list(unique.values()), count)
+        quiz = Quiz(topic=topic, difficulty=difficulty)
+        db.session.add(quiz)
+        db.session.flush()
+        for i, source in enumerate(picked, 1):
+            db.session.add(Question(
+                quiz_id=quiz.id,
+                question_text=source.question_text,
+                option_a=source.option_a,
+                option_b=source.option_b,
+                option_c=source.option_c,
+                option_d=source.option_d,
+                correct_option=source.correct_option,
+                explanation=source.explanation,
+                question_number=i
+            ))
+        db.session.commit()
+        return quiz
+
+
+quiz_cache = QuizCache()
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from gemini_client import gemini
+from models import Quiz, QuizJob, QuizPoolEntry, db
+from quiz_cache import normalize_topic
+
+
+class QuizPool:
+    """Warm pool of unused, pre-generated quizzes for the most requested topics.
+
+    Pooled quizzes live in the ``quiz_pool`` table. Each process keeps an
+    in-memory deque of candidate quiz ids per (topic, difficulty) key so a
+    pop is O(1); the pop is then confirmed with a conditional UPDATE so a
+    pooled quiz is handed to exactly one user even with several processes.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.size = 0
+        self.top_k = 0
+        self.window_hours = 24
+        self.concurrency = 1
+        self.hourly_budget = 0
+        self.interval = 60
+        self.offpeak_hours = None
+        self._index = defaultdict(deque)
+        self._lock = threading.Lock()
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.size = app.config.get('QUIZ_POOL_SIZE', 2)
+        self.top_k = app.config.get('QUIZ_POOL_TOP_K', 10)
+        self.window_hours = app.config.get('QUIZ_POOL_WINDOW_HOURS', 24)
+        self.concurrency = max(1, app.config.get('QUIZ_POOL_CONCURRENCY', 2))
+        self.hourly_budget = app.config.get('QUIZ_POOL_HOURLY_BUDGET', 20)
+        self.interval = app.config.get('QUIZ_POOL_INTERVAL', 60)
+        hours = app.config.get('QUIZ_POOL_OFFPEAK_HOURS', '')
+        try:
+            self.offpeak_hours = self._parse_hours(hours)
+        except ValueError:
+            app.logger.warning(f"Invalid QUIZ_POOL_OFFPEAK_HOURS '{hours}', refilling at any hour")
+            self.offpeak_hours = None
+
+    @staticmethod
+    def _parse_hours(value):
+        """Parse an 'start-end' UTC hour range such as '22-6'; empty means any hour"""
+        if not value:
+            return None
+        start, end = (int(part) for part in value.split('-', 1))
+        if not (0 <= start <= 23 and 0 <= end <= 23):
+            raise ValueError(f'Hours out of range: {value}')
+        return start, end
+
+    @property
+    def enabled(self):
+        return self.size > 0 and self.top_k > 0
+
+    def start(self):
+        """Load the pool index and start the replenisher once per process (safe to call repeatedly)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            # Threads do not survive a fork, so a preloaded gunicorn master
+            # must not count as "started" for its workers; pop() calls this
+            # again from inside the worker.
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        self.reload()
+        if gemini.available and self.hourly_budget > 0:
+            threading.Thread(target=self._run, name='quiz-pool', daemon=True).start()
+
+    def reload(self):
+        """Rebuild the in-memory index from unclaimed pool entries"""
+        rows = QuizPoolEntry.query.with_entities(QuizPoolEntry.quiz_id, QuizPoolEntry.topic_key,
+                                                 QuizPoolEntry.difficulty)\
+                                  .filter(QuizPoolEntry.claimed_at.is_(None))\
+                                  .order_by(QuizPoolEntry.created_at).all()
+        index = defaultdict(deque)
+        for quiz_id, topic_key, difficulty in rows:
+            index[(topic_key, difficulty)].append(quiz_id)
+        with self._lock:
+            self._index = index
+
+    def stats(self):
+        with self._lock:
+            return {
+                'keys': len(self._index),
+                'available': sum(len(ids) for ids in self._index.values()),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def pop(self, topic, difficulty):
+        """Hand out an unused pooled quiz for this topic, or None"""
+        if not self.enabled:
+            return None
+        self.start()
+        key = (normalize_topic(topic), difficulty)
+        while True:
+            with self._lock:
+                ids = self._index.get(key)
+                if not ids:
+                    self.misses += 1
+                    return None
+                quiz_id = ids.popleft()
+
+            claimed = QuizPoolEntry.query.filter_by(quiz_id=quiz_id, claimed_at=None)\
+                                         .update({'claimed_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                with self._lock:
+                    self.hits += 1
+                return db.session.get(Quiz, quiz_id)
+            # Another process claimed it first; try the next candidate
+
+    def popular_topics(self):
+        """Top-K (topic, difficulty) pairs by recent quiz requests, merged on normalized topic"""
+        since = datetime.utcnow() - timedelta(hours=self.window_hours)
+        count = func.count(Quiz.id)
+        rows = db.session.query(Quiz.topic, Quiz.difficulty, count)\
+                         .outerjoin(QuizPoolEntry, QuizPoolEntry.quiz_id == Quiz.id)\
+                         .filter(Quiz.created_at >= since)\
+                         .filter(db.or_(QuizPoolEntry.quiz_id.is_(None), QuizPoolEntry.claimed_at.isnot(None)))\
+                         .group_by(Quiz.topic, Quiz.difficulty)\
+                         .order_by(count.desc())\
+                         .limit(self.top_k * 20).all()
+
+        counts = Counter()
+        spelling = {}
+        for topic, difficulty, n in rows:
+            key = (normalize_topic(topic), difficulty)
+            counts[key] += n
+            # Rows come most frequent first, so keep the most common spelling
+            spelling.setdefault(key, topic)
+        return [(spelling[key], key[1]) for key, _ in counts.most_common(self.top_k)]
+
+    def is_off_peak(self):
+        """Refill only while no user generation is waiting and inside the configured hours"""
+        if QuizJob.query.filter_by(status='queued').count():
+            return False
+        if self.offpeak_hours is None:
+            return True
+        start, end = self.offpeak_hours
+        hour = datetime.utcnow().hour
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    def refill(self):
+        """Generate quizzes for popular topics that are below the pool size, within budget"""
+        now = datetime.utcnow()
+        QuizPoolEntry.query.filter(QuizPoolEntry.claimed_at.isnot(None),
+                                   QuizPoolEntry.created_at < now - timedelta(days=1))\
+                           .delete(synchronize_session=False)
+        db.session.commit()
+
+        spent = QuizPoolEntry.query.filter(QuizPoolEntry.created_at >= now - timedelta(hours=1)).count()
+        budget = self.hourly_budget - spent
+        if budget <= 0:
+            return 0
+
+        rows = db.session.query(QuizPoolEntry.topic_key, QuizPoolEntry.difficulty, func.count(QuizPoolEntry.quiz_id))\
+                         .filter(QuizPoolEntry.claimed_at.is_(None))\
+                         .group_by(QuizPoolEntry.topic_key, QuizPoolEntry.difficulty).all()
+        available = {(topic_key, difficulty): n for topic_key, difficulty, n in rows}
+
+        tasks = []
+        for topic, difficulty in self.popular_topics():
+            deficit = self.size - available.get((normalize_topic(topic), difficulty), 0)
+            for _ in range(min(deficit, budget - len(tasks))):
+                tasks.append((topic, difficulty))
+        if not tasks:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            generated = sum(executor.map(lambda task: self._generate(*task), tasks))
+        self.reload()
+        return generated
+
+    def _generate(self, topic, difficulty):
+        from ai_service import AIQuizGenerator
+
+        with self.app.app_context():
+            try:
+                # Pooled quizzes go to exactly one user, so they must not become the cached quiz
+                quiz = AIQuizGenerator().generate_quiz(topic, difficulty, use_cache=False, allow_fallback=False,
+                                                       cache=False)
+                if not quiz:
+                    return 0
+                db.session.add(QuizPoolEntry(quiz_id=quiz.id, topic_key=normalize_topic(topic),
+                                             difficulty=difficulty))
+                db.session.commit()
+                return 1
+            except Exception as e:
+                self.app.logger.error(f"Quiz pool refill failed for '{topic}': {e}")
+                db.session.rollback()
+                return 0
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.app.app_context():
+                try:
+                    # While the circuit is open every refill would fail without reaching Gemini
+                    if gemini.breaker.state != 'open' and self.is_off_peak():
+                        self.refill()
+                    else:
+                        self.reload()
+                except Exception as e:
+                    self.app.logger.error(f"Quiz pool replenisher error: {e}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+
+quiz_pool = QuizPool()
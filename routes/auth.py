@@ -1,12 +1,14 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from models import User, db
+from query_budget import query_budget
 from sqlalchemy import or_
 from werkzeug.security import check_password_hash
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@query_budget(3)
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('main.dashboard'))
@@ -36,6 +38,7 @@ def login():
     return render_template('auth/login.html')
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@query_budget(5)
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('main.dashboard'))
@@ -96,6 +99,7 @@ def register():
     return render_template('auth/register.html')
 
 @auth_bp.route('/logout')
+@query_budget(2)
 @login_required
 def logout():
     logout_user()
@@ -103,17 +107,17 @@ def logout():
     return redirect(url_for('main.index'))
 
 @auth_bp.route('/profile')
+@query_budget(8)
 @login_required
 def profile():
     # Get user statistics
-    from models import QuizResult
-    results = QuizResult.query.filter_by(user_id=current_user.id).all()
+    from models import QuizResult, UserStats
+    stats = UserStats.get_or_build(current_user.id).to_dict()
     
-    stats = {
-        'total_quizzes': len(results),
-        'average_score': round(sum([r.score for r in results]) / len(results), 1) if results else 0,
-        'best_score': max([r.score for r in results]) if results else 0,
-        'recent_results': [r.to_dict() for r in results[-5:]]  # Last 5 results
-    }
+    recent_results = QuizResult.query.options(db.joinedload(QuizResult.quiz))\
+                                    .filter_by(user_id=current_user.id)\
+                                    .order_by(QuizResult.taken_at.desc())\
+                                    .limit(5).all()
+    stats['recent_results'] = [r.to_dict() for r in recent_results]  # Last 5 results
     
     return render_template('auth/profile.html', stats=stats)
@@ -1,11 +1,31 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, abort, Response, stream_with_context, current_app, session
 from flask_login import login_required, current_user
-from models import Quiz, Question, QuizResult, db
-from ai_service import AIQuizGenerator, calculate_quiz_score
+from models import Quiz, QuizResult, QuizJob, UserStats, db
+from query_budget import query_budget
+from ai_service import AIQuizGenerator
+from answer_key import answer_keys, valid_answers
+from bulk_grading import grade_submissions
+from quiz_cache import quiz_cache
+from quiz_pool import quiz_pool
+from topic_index import topic_index
+from question_bank import question_bank
+from analytics import analytics
+from export import EXPORT_FORMATS, MIMETYPES, export_history, export_quizzes, gzipped
+from question_import import IMPORT_FORMATS, import_quizzes, read_quizzes
+from compression import stream_page
+from job_queue import job_queue, QueueFullError
+import base64
+import hashlib
 import json
+import os
+import time
+from datetime import datetime
 
 quiz_bp = Blueprint('quiz', __name__)
 
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
 @quiz_bp.route('/create', methods=['GET', 'POST'])
 @login_required
 def create_quiz():
@@ -34,15 +54,38 @@ def create_quiz():
             return render_template('quiz/create.html')
         
         try:
-            # Generate quiz using AI
-            ai_generator = AIQuizGenerator()
-            quiz = ai_generator.generate_quiz(topic.strip(), difficulty)
+            topic = topic.strip()
+            # Near-duplicate spellings of a known topic share its cache entry
+            topic = topic_index.match(topic) or topic
+            
+            # Popular topics are served from the warm pool of unused quizzes,
+            # repeat topics straight from the cache, known ones from the question bank
+            quiz = (quiz_pool.pop(topic, difficulty) or quiz_cache.get(topic, difficulty)
+                    or question_bank.assemble(topic, difficulty))
+            
+            if not quiz and job_queue.enabled:
+                job = job_queue.submit(current_user.id, topic, difficulty)
+                if request.is_json:
+                    return jsonify({
+                        'success': True,
+                        'job_id': job.id,
+                        'topic': topic,
+                        'status_url': url_for('quiz.job_status', job_id=job.id),
+                        'message': 'Quiz generation started'
+                    }), 202
+                return redirect(url_for('quiz.job_page', job_id=job.id))
+            
+            if not quiz:
+                # Generate quiz using AI
+                ai_generator = AIQuizGenerator()
+                quiz = ai_generator.generate_quiz(topic, difficulty, use_cache=False)
             
             if quiz:
                 if request.is_json:
                     return jsonify({
                         'success': True, 
                         'quiz_id': quiz.id,
+                        'topic': topic,
                         'message': 'Quiz generated successfully!'
                     })
                 flash('Quiz generated successfully!', 'success')
@@ -52,6 +95,11 @@ def create_quiz():
                 if request.is_json:
                     return jsonify({'success': False, 'message': error_msg}), 500
                 flash(error_msg, 'error')
+        
+        except QueueFullError as e:
+            if request.is_json:
+                return jsonify({'success': False, 'message': str(e)}), 503
+            flash(str(e), 'error')
                 
         except Exception as e:
             error_msg = f'Error generating quiz: {str(e)}'
@@ -61,76 +109,215 @@ def create_quiz():
     
     return render_template('quiz/create.html')
 
+def _get_user_job(job_id):
+    job = db.session.get(QuizJob, job_id)
+    if job is None or job.user_id != current_user.id:
+        abort(404)
+    return job
+
+@quiz_bp.route('/jobs/<job_id>')
+@query_budget(3)
+@login_required
+def job_page(job_id):
+    """Waiting page that follows a generation job until its quiz is ready"""
+    job = _get_user_job(job_id)
+    if job.quiz_id:
+        return redirect(url_for('quiz.take_quiz', quiz_id=job.quiz_id))
+    return render_template('quiz/generating.html', job=job)
+
+@quiz_bp.route('/api/jobs/<job_id>')
+@query_budget(3)
+@login_required
+def job_status(job_id):
+    """API endpoint to poll a generation job"""
+    job_queue.start()
+    job = _get_user_job(job_id)
+    data = job.to_dict()
+    if job.quiz_id:
+        data['take_url'] = url_for('quiz.take_quiz', quiz_id=job.quiz_id)
+    return jsonify(data)
+
+@quiz_bp.route('/api/jobs/<job_id>/events')
+@login_required
+def job_events(job_id):
+    """Server-Sent Events stream of a generation job's progress"""
+    job = _get_user_job(job_id)
+    
+    def generate():
+        last = None
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline:
+            current = db.session.get(QuizJob, job.id, populate_existing=True)
+            data = current.to_dict()
+            if current.quiz_id:
+                data['take_url'] = url_for('quiz.take_quiz', quiz_id=current.quiz_id)
+            # End the read transaction so the next poll sees the worker's commits
+            db.session.rollback()
+            if data != last:
+                yield f'data: {json.dumps(data)}\n\n'
+                last = data
+            if data['status'] in ('done', 'failed'):
+                return
+            time.sleep(0.5)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@quiz_bp.route('/api/jobs/stats')
+@query_budget(4)
+@login_required
+def job_stats():
+    """Generation queue depth and worker count"""
+    return jsonify(job_queue.stats())
+
+@quiz_bp.route('/api/pool/stats')
+@query_budget(2)
+@login_required
+def pool_stats():
+    """Warm pool size and hit counters"""
+    return jsonify(quiz_pool.stats())
+
+@quiz_bp.route('/api/topics')
+@query_budget(2)
+@login_required
+def topic_suggestions():
+    """Existing topics similar to ``q``, for offering a match before creating a quiz"""
+    topic = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 20)
+    if not topic:
+        return jsonify({'success': False, 'message': 'Query parameter q is required'}), 400
+    
+    return jsonify({
+        'success': True,
+        'topics': [{'topic': match, 'similarity': score} for match, score in topic_index.search(topic, limit)]
+    })
+
+def _conditional_response(etag, render, mimetype, cache_control):
+    """Answer If-None-Match with an empty 304, otherwise build the body with ``render()``"""
+    # Weak comparison: the compression layer weakens the ETags it gzips
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(render(), mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Cookie')
+    return response
+
+def _template_version(*names):
+    """Modification times of the templates a cached page depends on"""
+    folder = os.path.join(current_app.root_path, current_app.template_folder)
+    return ':'.join(str(os.stat(os.path.join(folder, name)).st_mtime_ns) for name in names)
+
 @quiz_bp.route('/take/<int:quiz_id>')
+@query_budget(4)
 @login_required
 def take_quiz(quiz_id):
-    quiz = Quiz.query.get_or_404(quiz_id)
-    questions = Question.query.filter_by(quiz_id=quiz_id).order_by(Question.question_number).all()
+    answer_key = answer_keys.get(quiz_id)
+    if answer_key is None:
+        abort(404)
     
-    # Convert questions to format without answers
-    questions_data = [q.to_dict(include_answer=False) for q in questions]
+    def render():
+        return render_template('quiz/take.html', quiz=answer_key, questions=answer_key.public_questions,
+                               generating=not answer_key.complete)
     
-    return render_template('quiz/take.html', quiz=quiz, questions=questions_data)
+    # Flashed messages are rendered once, so only pages without them can be revalidated
+    if not answer_key.complete or session.get('_flashes'):
+        return render()
+    
+    # The page also shows the user's name, so the ETag is per user
+    version = f'{answer_key.etag}:{current_user.id}:{_template_version("base.html", "quiz/take.html")}'
+    etag = hashlib.sha256(version.encode('utf-8')).hexdigest()[:32]
+    return _conditional_response(etag, render, 'text/html', 'private, no-cache')
 
 @quiz_bp.route('/api/quiz/<int:quiz_id>')
+@query_budget(4)
 @login_required
 def get_quiz_questions(quiz_id):
     """API endpoint to get quiz questions without answers"""
-    quiz = Quiz.query.get_or_404(quiz_id)
-    questions = Question.query.filter_by(quiz_id=quiz_id).order_by(Question.question_number).all()
+    answer_key = answer_keys.get(quiz_id)
+    if answer_key is None:
+        abort(404)
+    
+    # Clients polling a streaming quiz pass ?after=<question_number> to get only new questions
+    after = request.args.get('after', 0, type=int)
+    
+    if answer_key.complete and not after:
+        scope = 'public' if current_app.config.get('QUIZ_HTTP_CACHE_PUBLIC') else 'private'
+        max_age = current_app.config.get('QUIZ_HTTP_MAX_AGE', 86400)
+        return _conditional_response(answer_key.etag, lambda: answer_key.payload, 'application/json',
+                                     f'{scope}, max-age={max_age}, immutable')
     
     return jsonify({
         'quiz': {
-            'id': quiz.id,
-            'topic': quiz.topic,
-            'difficulty': quiz.difficulty
+            'id': answer_key.quiz_id,
+            'topic': answer_key.topic,
+            'difficulty': answer_key.difficulty
         },
-        'questions': [q.to_dict(include_answer=False) for q in questions]
+        'questions': [q for q in answer_key.public_questions if q['question_number'] > after],
+        'generating': not answer_key.complete
     })
 
 @quiz_bp.route('/api/quiz/<int:quiz_id>/submit', methods=['POST'])
+@query_budget(10)
 @login_required
 def submit_quiz(quiz_id):
     """Submit quiz answers and get results"""
-    quiz = Quiz.query.get_or_404(quiz_id)
+    # The cached answer key stands in for the quiz and its questions
+    answer_key = answer_keys.get(quiz_id)
+    if answer_key is None:
+        abort(404)
     
     # Get user answers
     data = request.get_json()
     user_answers = data.get('answers', {})
     
-    # Validate that all questions are answered
-    questions = Question.query.filter_by(quiz_id=quiz_id).all()
-    question_ids = {str(q.id) for q in questions}
-    answered_ids = set(user_answers.keys())
+    if not isinstance(user_answers, dict) or not valid_answers(user_answers):
+        return jsonify({
+            'success': False,
+            'message': 'Answers must map question ids to options'
+        }), 400
+    
+    if not answer_key.complete:
+        return jsonify({
+            'success': False,
+            'message': 'Quiz is still being generated'
+        }), 409
     
-    if not question_ids.issubset(answered_ids):
+    # Validate that all questions are answered
+    if not set(answer_key.question_ids).issubset(user_answers.keys()):
         return jsonify({
             'success': False, 
             'message': 'Please answer all questions before submitting'
         }), 400
     
     # Calculate score and get detailed results
-    score, detailed_results = calculate_quiz_score(quiz_id, user_answers)
+    packed_answers = answer_key.encode(user_answers)
+    score, detailed_results = answer_key.grade(packed_answers)
     
     # Save result to database
     try:
+        UserStats.record(current_user.id, score, answer_key.difficulty)
         quiz_result = QuizResult(
             user_id=current_user.id,
             quiz_id=quiz_id,
             score=score,
-            user_answers=user_answers
+            user_answers=packed_answers
         )
         db.session.add(quiz_result)
+        db.session.flush()
+        # Read the id before commit expires the instance and forces a reload
+        result_id = quiz_result.id
         db.session.commit()
         
         return jsonify({
             'success': True,
             'score': score,
-            'total_questions': len(questions),
-            'percentage': round((score / len(questions)) * 100, 1),
+            'total_questions': len(answer_key),
+            'percentage': round((score / len(answer_key)) * 100, 1),
             'results': detailed_results,
-            'result_id': quiz_result.id,
-            'redirect_url': url_for('quiz.view_results', result_id=quiz_result.id)
+            'result_id': result_id,
+            'redirect_url': url_for('quiz.view_results', result_id=result_id)
         })
         
     except Exception as e:
@@ -140,7 +327,169 @@ def submit_quiz(quiz_id):
             'message': f'Failed to save results: {str(e)}'
         }), 500
 
+@quiz_bp.route('/api/grade/bulk', methods=['POST'])
+@login_required
+def bulk_grade():
+    """Grade many submissions at once; only admins may grade for other users"""
+    data = request.get_json(silent=True) or {}
+    submissions = data.get('submissions')
+    
+    if not isinstance(submissions, list) or not all(isinstance(s, dict) for s in submissions):
+        return jsonify({'success': False, 'message': 'submissions must be a list of objects'}), 400
+    
+    max_submissions = current_app.config.get('BULK_GRADE_MAX_SUBMISSIONS', 50000)
+    if len(submissions) > max_submissions:
+        return jsonify({
+            'success': False,
+            'message': f'At most {max_submissions} submissions per request'
+        }), 413
+    
+    for submission in submissions:
+        submission.setdefault('user_id', current_user.id)
+        if submission['user_id'] != current_user.id and not current_user.is_admin:
+            return jsonify({'success': False, 'message': 'You can only grade your own submissions'}), 403
+    
+    try:
+        graded, errors = grade_submissions(submissions, save=data.get('save', True),
+                                           batch_size=current_app.config.get('BULK_GRADE_BATCH_SIZE', 1000))
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Failed to save results: {str(e)}'
+        }), 500
+    
+    return jsonify({
+        'success': not errors,
+        'graded': len(graded),
+        'results': graded,
+        'errors': errors
+    })
+
+@quiz_bp.route('/api/import', methods=['POST'])
+@login_required
+def import_questions():
+    """Bulk import quizzes from a JSON/NDJSON or CSV upload (admins only).
+    
+    The file is the ``file`` field of a multipart upload or the raw request
+    body. Pass ``?name=`` to make the import resumable: posting the same
+    file under the same name again continues after the last committed batch.
+    """
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    
+    upload = request.files.get('file')
+    filename = upload.filename if upload else ''
+    fmt = request.args.get('format') or ('csv' if filename.lower().endswith('.csv') or request.mimetype == 'text/csv' else 'json')
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'success': False, 'message': f'format must be one of {", ".join(IMPORT_FORMATS)}'}), 400
+    
+    try:
+        summary = import_quizzes(read_quizzes(upload.stream if upload else request.stream, fmt),
+                                 name=request.args.get('name') or None,
+                                 batch_size=current_app.config.get('QUESTION_IMPORT_BATCH_SIZE', 2000),
+                                 restart=request.args.get('restart', '').lower() in ('1', 'true'))
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Import failed: {str(e)}'
+        }), 500
+    
+    return jsonify(dict(summary, success=summary['complete'] and not summary['errors']))
+
+@quiz_bp.route('/api/quiz/<int:quiz_id>/leaderboard')
+@query_budget(2)
+@login_required
+def quiz_leaderboard(quiz_id):
+    """Best scores on one quiz"""
+    return jsonify({
+        'success': True,
+        'quiz_id': quiz_id,
+        'leaderboard': analytics.leaderboard('quiz', quiz_id, request.args.get('limit', 10, type=int))
+    })
+
+@quiz_bp.route('/api/leaderboard')
+@query_budget(2)
+@login_required
+def leaderboard():
+    """Best scores on a topic with ``?topic=``, otherwise total scores across all quizzes"""
+    limit = request.args.get('limit', 10, type=int)
+    topic = request.args.get('topic', '').strip()
+    if topic:
+        return jsonify({'success': True, 'topic': topic, 'leaderboard': analytics.leaderboard('topic', topic, limit)})
+    return jsonify({'success': True, 'leaderboard': analytics.global_leaderboard(limit)})
+
+@quiz_bp.route('/api/quiz/<int:quiz_id>/stats')
+@query_budget(6)
+@login_required
+def quiz_stats(quiz_id):
+    """Percent correct and most chosen wrong option per question, for admins and users who took the quiz"""
+    answer_key = answer_keys.get(quiz_id)
+    if answer_key is None:
+        abort(404)
+    
+    if not current_user.is_admin:
+        taken = db.session.query(
+            QuizResult.query.filter_by(user_id=current_user.id, quiz_id=quiz_id).exists()
+        ).scalar()
+        if not taken:
+            return jsonify({'success': False, 'message': 'Take the quiz to see its statistics'}), 403
+    
+    stats = analytics.question_stats(quiz_id)
+    return jsonify({
+        'success': True,
+        'quiz_id': quiz_id,
+        'questions': [dict(stats.get(qid, {'question_id': int(qid), 'attempts': 0}), question_number=number)
+                      for qid, (number, *_) in zip(answer_key.question_ids, answer_key.questions)]
+    })
+
+def _export_response(chunks, filename, fmt):
+    """Stream export chunks as a download, gzipped on the fly with ``?gzip=1``"""
+    mimetype = MIMETYPES[fmt]
+    filename = f'{filename}.{fmt}'
+    if request.args.get('gzip', '').lower() in ('1', 'true'):
+        chunks = gzipped(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def _export_format():
+    fmt = request.args.get('format', 'csv').lower()
+    return fmt if fmt in EXPORT_FORMATS else None
+
+@quiz_bp.route('/api/export/history')
+@login_required
+def export_history_api():
+    """Download the user's full quiz history as CSV or NDJSON; admins may pass ``?user_id=``"""
+    fmt = _export_format()
+    if fmt is None:
+        return jsonify({'success': False, 'message': f'format must be one of {", ".join(EXPORT_FORMATS)}'}), 400
+    
+    user_id = request.args.get('user_id', current_user.id, type=int)
+    if user_id != current_user.id and not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'You can only export your own history'}), 403
+    
+    chunks = export_history(user_id, fmt, batch_size=current_app.config.get('EXPORT_BATCH_SIZE', 1000))
+    return _export_response(chunks, f'quiz-history-{user_id}', fmt)
+
+@quiz_bp.route('/api/export/quizzes')
+@login_required
+def export_quizzes_api():
+    """Download every quiz with its questions as CSV or NDJSON (admins only)"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    
+    fmt = _export_format()
+    if fmt is None:
+        return jsonify({'success': False, 'message': f'format must be one of {", ".join(EXPORT_FORMATS)}'}), 400
+    
+    chunks = export_quizzes(fmt, batch_size=current_app.config.get('EXPORT_BATCH_SIZE', 1000))
+    return _export_response(chunks, 'quizzes', fmt)
+
 @quiz_bp.route('/results/<int:result_id>')
+@query_budget(5)
 @login_required
 def view_results(result_id):
     """View detailed quiz results"""
@@ -151,19 +500,80 @@ def view_results(result_id):
         flash('You can only view your own quiz results.', 'error')
         return redirect(url_for('main.dashboard'))
     
-    # Get detailed results
-    score, detailed_results = calculate_quiz_score(result.quiz_id, result.user_answers)
+    # Get detailed results; the answer key also carries the quiz topic
+    answer_key = answer_keys.get(result.quiz_id)
+    score, detailed_results = answer_key.grade(result.user_answers)
     
-    return render_template('quiz/results.html', 
-                         result=result, 
-                         detailed_results=detailed_results,
-                         quiz=result.quiz)
+    return stream_page('quiz/results.html',
+                       result=result,
+                       detailed_results=detailed_results,
+                       quiz=answer_key)
+
+def _encode_cursor(row):
+    raw = f'{row.taken_at.isoformat()}|{row.id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    """Return (taken_at, id) from a history cursor; raises ValueError if malformed"""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    taken_at, result_id = raw.split('|')
+    return datetime.fromisoformat(taken_at), int(result_id)
+
+def _history_page(user_id, cursor=None, limit=HISTORY_PAGE_SIZE):
+    """One page of a user's results, newest first, using keyset pagination.
+    
+    Seeks on the (user_id, taken_at, id) index instead of using OFFSET, so
+    every page costs the same however long the history is.
+    """
+    query = db.session.query(
+        QuizResult.id, QuizResult.quiz_id, QuizResult.score, QuizResult.taken_at,
+        Quiz.topic.label('quiz_topic'), Quiz.difficulty.label('quiz_difficulty')
+    ).join(Quiz, Quiz.id == QuizResult.quiz_id)\
+     .filter(QuizResult.user_id == user_id)
+    
+    if cursor:
+        query = query.filter(db.tuple_(QuizResult.taken_at, QuizResult.id) < _decode_cursor(cursor))
+    
+    rows = query.order_by(QuizResult.taken_at.desc(), QuizResult.id.desc()).limit(limit + 1).all()
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def _page_size():
+    return max(1, min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), HISTORY_MAX_PAGE_SIZE))
 
 @quiz_bp.route('/history')
+@query_budget(8)
 @login_required
 def quiz_history():
     """View user's quiz history"""
-    results = QuizResult.query.filter_by(user_id=current_user.id)\
-                             .order_by(QuizResult.taken_at.desc()).all()
+    cursor = request.args.get('cursor')
+    try:
+        results, next_cursor = _history_page(current_user.id, cursor, _page_size())
+    except ValueError:
+        return redirect(url_for('quiz.quiz_history'))
+    stats = UserStats.get_or_build(current_user.id).to_dict()
     
-    return render_template('quiz/history.html', results=results)
+    return stream_page('quiz/history.html', results=results, stats=stats,
+                       cursor=cursor, next_cursor=next_cursor)
+
+@quiz_bp.route('/api/history')
+@query_budget(2)
+@login_required
+def history_api():
+    """API endpoint for a page of the user's quiz history"""
+    try:
+        results, next_cursor = _history_page(current_user.id, request.args.get('cursor'), _page_size())
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+    
+    return jsonify({
+        'results': [{
+            'id': row.id,
+            'quiz_id': row.quiz_id,
+            'score': row.score,
+            'taken_at': row.taken_at.isoformat(),
+            'quiz_topic': row.quiz_topic,
+            'quiz_difficulty': row.quiz_difficulty
+        } for row in results],
+        'next_cursor': next_cursor
+    })
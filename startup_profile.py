@@ -0,0 +1,181 @@
+"""Cold start profile: how long a fresh process takes to serve its first request.
+
+Starts the app in new interpreters against a throwaway SQLite database and
+reports the time to import ``app`` (which builds it), the first request
+after that and the total from process spawn, plus an import-time breakdown
+by top-level package from ``python -X importtime``. Results can be saved as
+a JSON baseline and compared later, like benchmark.py:
+
+    python startup_profile.py --mode fast --save startup.json
+    python startup_profile.py --mode fast --compare startup.json
+
+With --mode fast the deploy steps (``flask init-db``, ``build-static`` and
+``compile-templates``) run once first and are timed separately, as they
+would be in a build step.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmark import _git_commit, percentile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEPLOY_COMMANDS = (['init-db'], ['build-static'], ['compile-templates'])
+CHILD = """
+import json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+from app import app
+imported = time.perf_counter()
+status = app.test_client().get({path!r}).status_code
+served = time.perf_counter()
+print(json.dumps({{'import_ms': (imported - started) * 1000, 'first_request_ms': (served - imported) * 1000,
+                  'status': status}}))
+sys.stdout.flush()
+# Skip waiting on the app's background threads
+os._exit(0)
+"""
+
+
+def _environment(args, workdir):
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        'STARTUP_MODE': args.mode,
+        'STATIC_BUILD_DIR': os.path.join(workdir, 'assets'),
+        'TEMPLATE_CACHE_DIR': os.path.join(workdir, 'jinja-cache'),
+        'GEMINI_API_KEY': '',
+        'QUIZ_POOL_SIZE': '0',
+        'ANALYTICS_INTERVAL': '0',
+        'METRICS_DIR': '',
+    })
+    # Cold starts still find compiled .pyc files, as they would after a deploy
+    for name in ('FLASK_RUN_FROM_CLI', 'PYTHONDONTWRITEBYTECODE'):
+        env.pop(name, None)
+    return env
+
+
+def _start(env, path, importtime=False):
+    """Start one app process; returns its timings, the wall time from spawn and its stderr"""
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else [])
+    command += ['-c', CHILD.format(root=ROOT, path=path)]
+    started = time.perf_counter()
+    result = subprocess.run(command, env=env, cwd=ROOT, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0 or not result.stdout.strip():
+        raise RuntimeError(f'App process failed:\n{result.stderr[-2000:]}')
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['total_ms'] = wall_ms
+    return timings, result.stderr
+
+
+def import_breakdown(stderr, top=15):
+    """Self import time in ms per top-level package from ``-X importtime`` output, largest first"""
+    packages = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        packages[name.strip().split('.')[0]] += int(self_us)
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return {name: round(us / 1000, 1) for name, us in ranked[:top]}
+
+
+def run(args):
+    with tempfile.TemporaryDirectory(prefix='quiz-startup-') as workdir:
+        env = _environment(args, workdir)
+        deploy = {}
+        if args.mode == 'fast':
+            for command in DEPLOY_COMMANDS:
+                started = time.perf_counter()
+                subprocess.run([sys.executable, '-m', 'flask', '--app', 'app'] + command, env=env, cwd=ROOT,
+                               check=True, capture_output=True)
+                deploy[command[0]] = round((time.perf_counter() - started) * 1000, 1)
+
+        runs = [_start(env, args.path)[0] for _ in range(args.runs)]
+        _, stderr = _start(env, args.path, importtime=True)
+
+    statuses = {sample['status'] for sample in runs}
+    return {
+        'commit': _git_commit(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'settings': {key: getattr(args, key) for key in ('mode', 'runs', 'path')},
+        'python': sys.version.split()[0],
+        'deploy_ms': deploy,
+        # The first process of a default start also creates the schema
+        'first_boot_ms': round(runs[0]['total_ms'], 1),
+        'import_ms': round(percentile([sample['import_ms'] for sample in runs], 50), 1),
+        'first_request_ms': round(percentile([sample['first_request_ms'] for sample in runs], 50), 1),
+        'total_ms': round(percentile([sample['total_ms'] for sample in runs], 50), 1),
+        'statuses': sorted(statuses),
+        'imports_ms': import_breakdown(stderr, args.top),
+    }
+
+
+def print_report(report):
+    if report['deploy_ms']:
+        print('Deploy steps: ' + ', '.join(f'{name} {ms} ms' for name, ms in report['deploy_ms'].items()))
+    print(f"{report['settings']['runs']} cold starts ({report['settings']['mode']} mode), median: "
+          f"import {report['import_ms']} ms, first request {report['first_request_ms']} ms, "
+          f"{report['total_ms']} ms from spawn (first boot {report['first_boot_ms']} ms), "
+          f"status {', '.join(map(str, report['statuses']))}")
+    print(f"\n{'package':<28}{'self import ms':>16}")
+    for name, ms in report['imports_ms'].items():
+        print(f'{name:<28}{ms:>16}')
+
+
+def compare(report, baseline, tolerance):
+    """Print changes against a baseline and return the regressions found"""
+    regressions = []
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('created_at')}):")
+    if baseline.get('settings') != report['settings']:
+        print(f"Warning: baseline was run with different settings {baseline.get('settings')}")
+    for key in ('import_ms', 'first_request_ms', 'total_ms'):
+        old, new = baseline.get(key), report[key]
+        if not old:
+            continue
+        change = (new - old) / old
+        print(f'{key:<28}{old:>10} -> {new:>10} ms ({change:+.0%})')
+        if change > tolerance:
+            regressions.append(f'{key} {old} -> {new} ms')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cold start profile for the quiz app')
+    parser.add_argument('--mode', default='default', choices=['default', 'fast'], help='STARTUP_MODE to start with')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh processes to time')
+    parser.add_argument('--path', default='/about', help='Page requested first')
+    parser.add_argument('--top', type=int, default=15, help='Packages listed in the import breakdown')
+    parser.add_argument('--save', metavar='PATH', help='Write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='Compare against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed slowdown before exiting non-zero')
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    print_report(report)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nSaved baseline to {args.save}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print('\nRegressions:')
+            for regression in regressions:
+                print(f'  {regression}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
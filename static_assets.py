@@ -0,0 +1,269 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+from flask import abort, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ONE_YEAR = 31536000
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+WHITESPACE = ' \t\r\n\f'
+# Spaces next to these are never needed in CSS (a space before ':' is: "a :hover")
+CSS_TIGHT = '{};,>'
+CSS_TIGHT_AFTER = CSS_TIGHT + ':'
+# After these a '/' in JavaScript starts a regex literal, not a division
+JS_REGEX_PREFIX = '(,=:[!&|?{};+-*%<>~^'
+# ... and after these keywords ("return /x/.test(s)")
+JS_REGEX_KEYWORDS = frozenset(('return', 'typeof', 'case', 'do', 'else', 'in', 'instanceof', 'new', 'delete',
+                               'void', 'throw', 'yield', 'await'))
+
+
+def _is_word(char):
+    return char.isalnum() or char in '_$\\' or ord(char) > 127
+
+
+def _ends_with_keyword(out):
+    """Whether the output so far ends with a keyword after which '/' starts a regex"""
+    word = []
+    for piece in reversed(out):
+        for char in reversed(piece):
+            if not _is_word(char):
+                # A property such as obj.return is not the keyword
+                return char != '.' and ''.join(reversed(word)) in JS_REGEX_KEYWORDS
+            word.append(char)
+    return ''.join(reversed(word)) in JS_REGEX_KEYWORDS
+
+
+def minify(text, kind):
+    """Conservatively minify CSS (``kind='css'``) or JavaScript (``'js'``).
+
+    Drops comments and redundant whitespace while copying strings, template
+    literals and regex literals untouched. JavaScript keeps one newline
+    wherever the source had a line break, so automatic semicolon insertion
+    behaves exactly as before.
+    """
+    out = []
+    pending = None
+    i, n = 0, len(text)
+    while i < n:
+        char = text[i]
+        if char in WHITESPACE:
+            j = i
+            while j < n and text[j] in WHITESPACE:
+                j += 1
+            if pending != '\n':
+                pending = '\n' if kind == 'js' and '\n' in text[i:j] else ' '
+            i = j
+            continue
+        if text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+            if kind == 'js' and '\n' in text[i:end]:
+                pending = '\n'
+            else:
+                pending = pending or ' '
+            i = end
+            continue
+        if kind == 'js' and text.startswith('//', i):
+            end = text.find('\n', i)
+            i = n if end == -1 else end
+            continue
+
+        prev = out[-1][-1] if out else ''
+        if pending and out:
+            if kind == 'css':
+                if prev not in CSS_TIGHT_AFTER and char not in CSS_TIGHT:
+                    out.append(' ')
+            elif pending == '\n':
+                out.append('\n')
+            elif (_is_word(prev) and _is_word(char)) or (prev == char and char in '+-'):
+                out.append(' ')
+            prev = out[-1][-1]
+        pending = None
+
+        if char in '"\'' or (kind == 'js' and char == '`'):
+            j = i + 1
+            while j < n and text[j] != char:
+                j += 2 if text[j] == '\\' else 1
+            out.append(text[i:j + 1])
+            i = j + 1
+        elif kind == 'js' and char == '/' and (not prev or prev in JS_REGEX_PREFIX or prev == '\n'
+                                               or (_is_word(prev) and _ends_with_keyword(out))):
+            j = i + 1
+            in_class = False
+            while j < n and (in_class or text[j] != '/'):
+                if text[j] == '\\':
+                    j += 1
+                elif text[j] == '[':
+                    in_class = True
+                elif text[j] == ']':
+                    in_class = False
+                j += 1
+            out.append(text[i:j + 1])
+            i = j + 1
+        else:
+            if kind == 'css' and char == '}' and prev == ';':
+                out.pop()
+            out.append(char)
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+
+def _write(path, data):
+    """Write a file atomically so concurrent workers building at once never serve a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class StaticAssets:
+    """Fingerprinted, precompressed copies of ``static/`` with one-year caching.
+
+    ``build()`` minifies CSS and JS, names every file after a hash of its
+    content (``css/modern.css`` -> ``css/modern.1a2b3c4d5e6f.css``) and
+    writes gzip and, with the ``brotli`` package installed, brotli
+    variants next to it. Templates link to assets with ``asset_url()``, and
+    ``/assets/<name>`` serves the smallest variant the browser accepts as
+    immutable, since any change to a file changes its URL.
+
+    The manifest records each source's size and mtime, so a restart reuses
+    the previous build for unchanged files instead of minifying and
+    compressing everything again. If the build is disabled or fails, ``asset_url()`` falls back to
+    Flask's plain static URLs.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.build_dir = None
+        self.source_dir = None
+        self._manifest = {}
+        self._encodings = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('STATIC_ASSETS_ENABLED', True)
+        self.source_dir = app.static_folder
+        self.build_dir = app.config.get('STATIC_BUILD_DIR') or os.path.join(app.instance_path, 'assets')
+        self._manifest = {}
+        self._encodings = {}
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+        app.add_template_global(self.asset_url)
+        if self.enabled:
+            try:
+                self.build()
+            except OSError as e:
+                app.logger.warning(f"Static asset build failed, serving plain static files: {e}")
+
+    def _previous_build(self):
+        try:
+            with open(os.path.join(self.build_dir, MANIFEST), 'rb') as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Manifests from before sizes were recorded map straight to the target name
+        return {source: entry for source, entry in previous.items() if isinstance(entry, dict)}
+
+    def _reusable(self, entry, stat):
+        if entry is None or entry.get('size') != stat.st_size or entry.get('mtime_ns') != stat.st_mtime_ns:
+            return False
+        suffixes = dict(ENCODINGS)
+        return all(os.path.exists(os.path.join(self.build_dir, entry['target'] + suffixes.get(encoding, '')))
+                   for encoding in [None] + entry['encodings'])
+
+    def build(self, force=False):
+        """Build every asset and return the manifest of source -> fingerprinted names.
+
+        Files unchanged since the last build are reused unless ``force``.
+        """
+        previous = {} if force else self._previous_build()
+        manifest = {}
+        encodings = {}
+        for root, _, files in os.walk(self.source_dir):
+            for name in sorted(files):
+                source = os.path.relpath(os.path.join(root, name), self.source_dir).replace(os.sep, '/')
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                entry = previous.get(source)
+                if self._reusable(entry, stat):
+                    manifest[source] = entry
+                    encodings[entry['target']] = entry['encodings']
+                    continue
+
+                with open(path, 'rb') as f:
+                    data = f.read()
+                stem, ext = os.path.splitext(source)
+                if ext in ('.css', '.js'):
+                    data = minify(data.decode('utf-8'), ext[1:]).encode('utf-8')
+
+                target = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+                _write(os.path.join(self.build_dir, target), data)
+                manifest[source] = {'target': target, 'encodings': [], 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+                encodings[target] = manifest[source]['encodings']
+                if ext not in COMPRESSIBLE:
+                    continue
+                variants = {'gzip': gzip.compress(data, 9, mtime=0)}
+                if brotli is not None:
+                    variants['br'] = brotli.compress(data, quality=11)
+                for encoding, suffix in ENCODINGS:
+                    if encoding in variants and len(variants[encoding]) < len(data):
+                        _write(os.path.join(self.build_dir, target + suffix), variants[encoding])
+                        encodings[target].append(encoding)
+
+        if manifest != previous:
+            _write(os.path.join(self.build_dir, MANIFEST), json.dumps(manifest, indent=2).encode('utf-8'))
+            self._prune(encodings)
+        self._manifest = {source: entry['target'] for source, entry in manifest.items()}
+        self._encodings = encodings
+        return self._manifest
+
+    def _prune(self, targets):
+        """Delete assets left over from earlier builds"""
+        keep = {MANIFEST}
+        for target in targets:
+            keep.update([target] + [target + suffix for _, suffix in ENCODINGS])
+        for root, _, files in os.walk(self.build_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if not name.startswith('.') and os.path.relpath(path, self.build_dir).replace(os.sep, '/') not in keep:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        # Another worker building at the same time got there first
+                        pass
+
+    def asset_url(self, filename):
+        """Like ``url_for('static', filename=...)``, but to the fingerprinted asset when one is built"""
+        target = self._manifest.get(filename)
+        if target is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=target)
+
+    def serve(self, filename):
+        encodings = self._encodings.get(filename)
+        if encodings is None:
+            abort(404)
+
+        encoding = request.accept_encodings.best_match(encodings) if encodings else None
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(self.build_dir, filename + dict(ENCODINGS)[encoding] if encoding else filename,
+                                       mimetype=mimetype, max_age=ONE_YEAR)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+static_assets = StaticAssets()
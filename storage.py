@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import threading
+import weakref
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import TextClause
+
+STORAGE_MODES = ('default', 'wal')
+
+
+class SQLiteStorage:
+    """Production SQLite mode: WAL, tuned pragmas and separate read/write engines.
+
+    With SQLITE_MODE=wal every connection gets the configured pragmas, the
+    app's own engine becomes a single serialized writer (a pool of one
+    connection) and SELECTs go to a read-only pool on the same file. WAL lets
+    those readers run while a write is in progress instead of hitting
+    "database is locked".
+    """
+
+    def __init__(self):
+        self.mode = 'default'
+        self.busy_timeout = 5000
+        self.cache_size_kb = 20000
+        self.mmap_size = 256 * 1024 * 1024
+        self.read_pool_size = 10
+        # Keyed by writer engine, so two apps on one file do not share listeners
+        self._readers = weakref.WeakKeyDictionary()
+        self._listeners = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._listening = False
+
+    @property
+    def enabled(self):
+        return self.mode == 'wal'
+
+    def init_app(self, app):
+        """Configure the writer engine; must run before ``db.init_app``"""
+        mode = app.config.get('SQLITE_MODE', 'default')
+        if mode not in STORAGE_MODES:
+            app.logger.warning(f"Unknown SQLITE_MODE '{mode}', using default SQLite settings")
+            mode = 'default'
+        if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+            mode = 'default'
+
+        self.mode = mode
+        self.busy_timeout = app.config.get('SQLITE_BUSY_TIMEOUT', 5000)
+        self.cache_size_kb = app.config.get('SQLITE_CACHE_SIZE_KB', 20000)
+        self.mmap_size = app.config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+        self.read_pool_size = app.config.get('SQLITE_READ_POOL_SIZE', 10)
+        if not self.enabled:
+            return
+
+        options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        options.setdefault('pool_size', 1)
+        options.setdefault('max_overflow', 0)
+        options.setdefault('pool_timeout', max(30, self.busy_timeout / 1000))
+
+        if not self._listening:
+            event.listen(Engine, 'connect', self._configure_connection)
+            self._listening = True
+
+    def _configure_connection(self, dbapi_connection, connection_record):
+        if not self.enabled or not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            # The journal mode is stored in the file, so read-only connections keep WAL
+            if not cursor.execute('PRAGMA query_only').fetchone()[0]:
+                cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+            cursor.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+            cursor.execute('PRAGMA temp_store=MEMORY')
+        finally:
+            cursor.close()
+
+    def reader_for(self, writer):
+        """Read-only engine on the writer's database file, or None when not in WAL mode"""
+        if not self.enabled or writer.dialect.name != 'sqlite':
+            return None
+        reader = self._readers.get(writer)
+        if reader is None:
+            with self._lock:
+                reader = self._readers.get(writer)
+                if reader is None:
+                    reader = self._readers[writer] = self._create_reader(writer)
+        return reader
+
+    def _create_reader(self, writer):
+        path = os.path.abspath(writer.url.database)
+
+        def connect():
+            connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+            connection.execute('PRAGMA query_only=1')
+            return connection
+
+        reader = create_engine('sqlite://', creator=connect, poolclass=QueuePool,
+                               pool_size=self.read_pool_size, max_overflow=self.read_pool_size)
+        for identifier, fn in self._listeners.get(writer, ()):
+            event.listen(reader, identifier, fn)
+        return reader
+
+    def listen(self, engine, identifier, fn):
+        """Listen for an engine event on the writer and on its read-only engine"""
+        event.listen(engine, identifier, fn)
+        with self._lock:
+            self._listeners.setdefault(engine, []).append((identifier, fn))
+            reader = self._readers.get(engine)
+        if reader is not None:
+            event.listen(reader, identifier, fn)
+
+
+class RoutingSession(Session):
+    """Session that sends plain SELECTs to the read-only engine.
+
+    ORM selects and raw ``SELECT`` text (such as question bank searches) go
+    to the reader; flushes, DML and other raw SQL use the writer, and once a
+    transaction has written, its later reads stay on the writer so they see
+    its changes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        writer = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None:
+            return writer
+        reader = storage.reader_for(writer)
+        if reader is None:
+            return writer
+        if self._flushing or self.info.get('wrote') or not _is_read(clause):
+            self.info['wrote'] = True
+            return writer
+        return reader
+
+
+def _is_read(clause):
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip()[:6].upper() == 'SELECT'
+    return isinstance(clause, Select)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _reset_writer(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('wrote', None)
+
+
+storage = SQLiteStorage()
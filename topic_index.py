@@ -0,0 +1,191 @@
+import heapq
+import math
+import threading
+import time
+from array import array
+from collections import Counter
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from models import Quiz, db
+from quiz_cache import normalize_topic
+from storage import RoutingSession
+
+STOPWORDS = frozenset(('a', 'an', 'the', 'of', 'and', 'in', 'on', 'for', 'to', 'with', 'about'))
+# Extra rare trigrams scanned so candidates must share several of them, not just one
+PREFIX_EXTRA = 2
+
+
+def canonical_topic(topic):
+    """Normalized topic with stopwords dropped and words sorted, so word order does not matter"""
+    words = normalize_topic(topic).split()
+    return ' '.join(sorted(word for word in words if word not in STOPWORDS) or words)
+
+
+def trigrams(key):
+    """Character trigrams of each word, padded so short words and word edges count"""
+    grams = set()
+    for word in key.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _numbers(key):
+    return {word for word in key.split() if any(c.isdigit() for c in word)}
+
+
+class TopicIndex:
+    """In-memory trigram index over existing ``Quiz.topic`` values.
+
+    Topics are reduced to a canonical key ("Python Basics!", "basics of
+    python" -> "basics python") and matched on the Jaccard similarity of
+    their trigram sets. Postings are compact arrays of key ids, and lookups
+    only scan the postings of a query's rarest trigrams (prefix filtering),
+    so top-k stays fast with millions of topics. Topics containing numbers
+    only match the same numbers ("World War 1" never becomes "World War 2").
+
+    The index is built from the database on first use, grows as quizzes are
+    committed in this process and catches up with other processes' quizzes
+    every QUIZ_TOPIC_INDEX_REFRESH seconds.
+    """
+
+    def __init__(self, app=None):
+        self.threshold = 0.85
+        self.refresh_interval = 30
+        self._keys = []
+        self._topics = []
+        self._sizes = array('H')
+        self._ids = {}
+        self._postings = {}
+        self._last_quiz_id = 0
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.threshold = app.config.get('QUIZ_TOPIC_MATCH_THRESHOLD', 0.85)
+        self.refresh_interval = app.config.get('QUIZ_TOPIC_INDEX_REFRESH', 30)
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._keys = []
+            self._topics = []
+            self._sizes = array('H')
+            self._ids = {}
+            self._postings = {}
+            self._last_quiz_id = 0
+            self._refreshed_at = None
+
+    def stats(self):
+        with self._lock:
+            return {'topics': len(self._keys), 'trigrams': len(self._postings),
+                    'last_quiz_id': self._last_quiz_id}
+
+    def add(self, topic):
+        """Index a topic; the first spelling seen for a canonical key is the one matches return"""
+        key = canonical_topic(topic)
+        if not key:
+            return
+        grams = trigrams(key)
+        with self._lock:
+            if key in self._ids:
+                return
+            key_id = len(self._keys)
+            self._ids[key] = key_id
+            self._keys.append(key)
+            self._topics.append(topic)
+            self._sizes.append(min(len(grams), 0xFFFF))
+            for gram in grams:
+                postings = self._postings.get(gram)
+                if postings is None:
+                    postings = self._postings[gram] = array('I')
+                postings.append(key_id)
+
+    def refresh(self):
+        """Index quizzes inserted since the last refresh (all of them the first time)"""
+        self._refreshed_at = time.monotonic()
+        rows = db.session.query(Quiz.id, Quiz.topic).filter(Quiz.id > self._last_quiz_id)\
+                         .order_by(Quiz.id).yield_per(10000)
+        last_id = self._last_quiz_id
+        for quiz_id, topic in rows:
+            self.add(topic)
+            last_id = quiz_id
+        with self._lock:
+            self._last_quiz_id = max(self._last_quiz_id, last_id)
+
+    def _maybe_refresh(self):
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.refresh_interval:
+            self.refresh()
+
+    def search(self, topic, limit=5, threshold=0.5):
+        """Top ``limit`` indexed topics as ``(topic, similarity)``, best first"""
+        self._maybe_refresh()
+        key = canonical_topic(topic)
+        if not key:
+            return []
+        grams = trigrams(key)
+        numbers = _numbers(key)
+
+        with self._lock:
+            key_id = self._ids.get(key)
+            if key_id is not None:
+                exact = [(self._topics[key_id], 1.0)]
+                if limit == 1:
+                    return exact
+            else:
+                exact = []
+
+            # A match shares at least ``needed`` trigrams, so it contains at
+            # least extra + 1 of the (|grams| - needed + 1 + extra) rarest ones
+            ordered = sorted(grams, key=lambda gram: len(self._postings.get(gram, ())))
+            needed = math.ceil(threshold * len(grams))
+            extra = min(PREFIX_EXTRA, needed - 1)
+            counts = Counter()
+            for gram in ordered[:len(grams) - needed + 1 + extra]:
+                counts.update(self._postings.get(gram, ()))
+            candidates = [candidate for candidate, count in counts.items()
+                          if count > extra and candidate != key_id]
+
+            min_size, max_size = threshold * len(grams), len(grams) / threshold if threshold else math.inf
+            scored = []
+            for candidate in candidates:
+                size = self._sizes[candidate]
+                if size < min_size or size > max_size:
+                    continue
+                other = self._keys[candidate]
+                shared = len(grams & trigrams(other))
+                score = shared / (len(grams) + size - shared)
+                if score >= threshold and _numbers(other) == numbers:
+                    scored.append((score, candidate))
+
+            best = heapq.nlargest(limit - len(exact), scored)
+            return exact + [(self._topics[candidate], round(score, 3)) for score, candidate in best]
+
+    def match(self, topic):
+        """Existing topic close enough to reuse in place of ``topic``, or None"""
+        if not self.threshold:
+            return None
+        found = self.search(topic, limit=1, threshold=self.threshold)
+        return found[0][0] if found else None
+
+
+topic_index = TopicIndex()
+
+
+@event.listens_for(Quiz, 'after_insert')
+def _queue_topic(mapper, connection, target):
+    # Indexed only once the quiz is committed, so a rolled back insert leaves no topic behind
+    object_session(target).info.setdefault('new_topics', []).append(target.topic)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _index_topics(session):
+    for topic in session.info.pop('new_topics', ()):
+        topic_index.add(topic)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _drop_topics(session):
+    session.info.pop('new_topics', None)
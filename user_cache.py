@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import event
+from models import User, db
+
+
+class CachedUser(UserMixin):
+    """Stand-in for the logged-in User built from cached identity fields.
+
+    Attributes other than the cached fields load the real row from the
+    current session on first access.
+    """
+
+    FIELDS = ('id', 'username', 'email', 'created_at')
+
+    def __init__(self, fields, user=None):
+        self.__dict__.update(fields)
+        self.__dict__['_user'] = user
+
+    is_admin = User.is_admin
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        user = self.__dict__['_user']
+        if user is None:
+            user = self.__dict__['_user'] = db.session.get(User, self.id)
+        return getattr(user, name)
+
+    def __repr__(self):
+        return f'<User {self.username}>'
+
+
+class UserCache:
+    """Size-bounded, TTL'd LRU of user identity fields for the Flask-Login user_loader.
+
+    Updating or deleting a User row evicts it in this process; other
+    processes pick the change up when the entry expires.
+    """
+
+    def __init__(self, app=None):
+        self.max_entries = 10000
+        self.ttl = 300
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('USER_CACHE_SIZE', 10000)
+        self.ttl = app.config.get('USER_CACHE_TTL', 300)
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def load(self, user_id):
+        """Return the user for a session's user id, or None if it no longer exists"""
+        if not self.max_entries:
+            return db.session.get(User, user_id)
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return CachedUser(entry[1])
+            self.misses += 1
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        fields = {field: getattr(user, field) for field in CachedUser.FIELDS}
+        with self._lock:
+            self._entries[user_id] = (now, fields)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return CachedUser(fields, user)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user(mapper, connection, target):
+    user_cache.invalidate(target.id)